@@ -1,4 +1,5 @@
 from accounts.models import UserProfile
+from accounts.services import UserService
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -11,16 +12,23 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UserSerializerWithProfile(serializers.ModelSerializer):
-    nickname = serializers.CharField(source='profile.nickname')
+    nickname = serializers.SerializerMethodField()
     avatar_url = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ('id', 'username', 'nickname', 'avatar_url')
 
+    def _get_profile(self, obj):
+        return UserService.get_prefetched_userprofile(self.context, obj.id)
+
+    def get_nickname(self, obj):
+        return self._get_profile(obj).nickname
+
     def get_avatar_url(self, obj):
-        if obj.profile.avatar:
-            return obj.profile.avatar.url
+        profile = self._get_profile(obj)
+        if profile.avatar:
+            return profile.avatar.url
         return None
 
 
@@ -17,11 +17,9 @@ class UserProfile(models.Model):
 def get_profile(user):
     from accounts.services import UserService
 
-    if hasattr(user, '_cached_user_profile'):
-        return getattr(user, '_cached_user_profile')
-    user_profile = UserService.get_userprofile_in_memcached(user.id)
-    setattr(user, '_cached_user_profile', user_profile)
-    return user_profile
+    # user may be shared by process local cache, so profile is not kept on user object,
+    # it is fetched once per request by RequestCache, serializers keep it in their context
+    return UserService.get_userprofile_in_memcached(user.id)
 
 User.profile = property(get_profile)
 
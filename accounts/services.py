@@ -5,6 +5,10 @@ from utils.memcached.memcached_helper import (
     project_memcached, 
     MemcachedHelper,
 )
+from utils.memcached.request_cache import RequestCache
+
+# key in serializer context, {user id: userprofile}
+PREFETCHED_PROFILES = 'prefetched_profiles'
 
 
 class UserService:
@@ -17,18 +21,82 @@ class UserService:
     def get_userprofile_in_memcached(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
 
+        # fetched in this request already
+        hit, userprofile = RequestCache.get(key)
+        if hit:
+            return userprofile
+
         # get userprofile from cache first
         userprofile = project_memcached.get(key)
-        if userprofile:
+        if userprofile is not None:
+            RequestCache.set_many({key: userprofile})
             return userprofile
 
         # if not found in cache, go to sql
-        userprofile, _ = UserProfile.objects.get_or_create(user_id=user_id)
-        project_memcached.set(key, userprofile)
+        userprofile = MemcachedHelper.load_with_lock(
+            key,
+            lambda: UserProfile.objects.get_or_create(user_id=user_id)[0],
+        )
+        RequestCache.set_many({key: userprofile})
         return userprofile
 
+    @classmethod
+    def get_userprofiles_in_memcached(cls, user_ids):
+        # => {user_id: userprofile}, one get_many and one query for all users
+        keys = {USER_PROFILE_PATTERN.format(user_id=user_id): user_id for user_id in user_ids}
+        if not keys:
+            return {}
+        found, missed_keys = RequestCache.get_many(keys)
+        userprofiles = {keys[key]: userprofile for key, userprofile in found.items()}
+        if not missed_keys:
+            return userprofiles
+
+        cached = project_memcached.get_many(missed_keys)
+        RequestCache.set_many(cached)
+        userprofiles.update({keys[key]: userprofile for key, userprofile in cached.items()})
+
+        missed_ids = [user_id for user_id in keys.values() if user_id not in userprofiles]
+        if missed_ids:
+            missed_profiles = {
+                userprofile.user_id: userprofile
+                for userprofile in UserProfile.objects.filter(user_id__in=missed_ids)
+            }
+            # profile is created at first access, same as get_userprofile_in_memcached
+            for user_id in missed_ids:
+                if user_id not in missed_profiles:
+                    missed_profiles[user_id], _ = UserProfile.objects.get_or_create(user_id=user_id)
+            cached = {
+                USER_PROFILE_PATTERN.format(user_id=user_id): userprofile
+                for user_id, userprofile in missed_profiles.items()
+            }
+            project_memcached.set_many(cached)
+            RequestCache.set_many(cached)
+            userprofiles.update(missed_profiles)
+        return userprofiles
+
+    @classmethod
+    def prefetch_users_in_memcached(cls, context, user_ids, with_profile=False):
+        users = MemcachedHelper.prefetch_objects_in_memcached(context, User, user_ids)
+        if with_profile:
+            profiles = context.setdefault(PREFETCHED_PROFILES, {})
+            profiles.update(cls.get_userprofiles_in_memcached([
+                user_id
+                for user_id in users
+                if user_id not in profiles
+            ]))
+        return users
+
+    @classmethod
+    def get_prefetched_userprofile(cls, context, user_id):
+        # profile is fetched at most once per serializer context, also out of a request
+        profiles = context.setdefault(PREFETCHED_PROFILES, {})
+        if user_id not in profiles:
+            profiles[user_id] = cls.get_userprofile_in_memcached(user_id)
+        return profiles[user_id]
+
     @classmethod
     def invalidate_userprofile_in_memcached(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
         project_memcached.delete(key)
+        RequestCache.delete(key)
 
@@ -1,6 +1,8 @@
 from django.test import TestCase
 from utils.test_helpers import TestHelpers
+from accounts.api.serializers import UserSerializerWithProfile
 from accounts.models import UserProfile
+from accounts.services import PREFETCHED_PROFILES
 
 
 class UserProfileTests(TestCase):
@@ -13,3 +15,8 @@ class UserProfileTests(TestCase):
         admin_profile = admin.profile
         self.assertTrue(isinstance(admin_profile, UserProfile))
         self.assertEqual(UserProfile.objects.all().count(), 1)
+
+        # profile is kept in serializer context, also out of a request
+        serializer = UserSerializerWithProfile(admin)
+        self.assertEqual(serializer.data['avatar_url'], None)
+        self.assertEqual(serializer.context[PREFETCHED_PROFILES], {admin.id: admin_profile})
@@ -1,6 +1,7 @@
 from accounts.api.serializers import UserSerializerWithProfile
 from comments.models import Comment
 from django.contrib.auth.models import User
+from django.db import models
 from inbox.services import NotificationSerivce
 from likes.services import LikeServices
 from rest_framework import serializers
@@ -8,6 +9,15 @@ from rest_framework.exceptions import ValidationError
 from tweets.models import Tweet
 
 
+class CommentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # likes of the whole page are loaded in one batch
+        # comments of a tweet come as related manager in tweet details
+        comments = list(data.all() if isinstance(data, models.Manager) else data)
+        LikeServices.prefetch_liked_object_ids(self.context, Comment, [comment.id for comment in comments])
+        return super().to_representation(comments)
+
+
 class CommentSerializer(serializers.ModelSerializer):
     user = UserSerializerWithProfile(source='cached_user')
     has_like = serializers.SerializerMethodField()
@@ -24,9 +34,10 @@ class CommentSerializer(serializers.ModelSerializer):
             'has_like', 
             'likes_count'
         )
+        list_serializer_class = CommentListSerializer
 
     def get_has_like(self, obj):
-        return LikeServices.has_liked(self.context['user'], obj)
+        return LikeServices.has_liked_in_context(self.context, obj)
 
     def get_likes_count(self, obj):
         return obj.like_set.count()
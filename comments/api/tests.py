@@ -3,6 +3,7 @@ from django.test import TestCase
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
+from tweets.tasks import flush_count_deltas_task
 from utils.test_helpers import TestHelpers
 
 BASE_COMMENT_URL = '/api/comments/{}'
@@ -184,6 +185,8 @@ class CommentApiTests(TestCase):
         self.user1_client.post(CREATE_COMMENT_URL, data)
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.data['comments_count'], 1)
+        # counts are written to db by flush task
+        flush_count_deltas_task()
         self.tweet1.refresh_from_db()
         self.assertEqual(self.tweet1.comments_count, 1)
 
@@ -192,6 +195,7 @@ class CommentApiTests(TestCase):
         comment_response = self.user2_client.post(CREATE_COMMENT_URL, data)
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.data['comments_count'], 2)
+        flush_count_deltas_task()
         self.tweet1.refresh_from_db()
         self.assertEqual(self.tweet1.comments_count, 2)
 
@@ -201,6 +205,7 @@ class CommentApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.data['comments_count'], 2)
+        flush_count_deltas_task()
         self.tweet1.refresh_from_db()
         self.assertEqual(self.tweet1.comments_count, 2)
 
@@ -210,5 +215,6 @@ class CommentApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.data['comments_count'], 1)
+        flush_count_deltas_task()
         self.tweet1.refresh_from_db()
         self.assertEqual(self.tweet1.comments_count, 1)
\ No newline at end of file
@@ -1,9 +1,23 @@
 from accounts.api.serializers import UserSerializer, UserSerializerWithProfile
+from django.contrib.auth.models import User
 from friendships.models import Friendship
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
 from friendships.services import FriendshipService
 from accounts.services import UserService
+from utils.memcached.memcached_helper import MemcachedHelper
+
+
+class FriendshipListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # users of the whole page are loaded in one batch
+        friendships = list(data)
+        UserService.prefetch_users_in_memcached(
+            self.context,
+            [friendship.from_user_id for friendship in friendships] +
+            [friendship.to_user_id for friendship in friendships],
+        )
+        return super().to_representation(friendships)
 
 
 class FriendshipSerializer(serializers.Serializer):
@@ -13,12 +27,15 @@ class FriendshipSerializer(serializers.Serializer):
     followed_from_user = serializers.SerializerMethodField()
     followed_to_user = serializers.SerializerMethodField()
 
+    class Meta:
+        list_serializer_class = FriendshipListSerializer
+
     def get_from_user(self, obj):
-        user = UserService.get_user_in_memcached(obj.from_user_id)
+        user = MemcachedHelper.get_prefetched_object(self.context, User, obj.from_user_id)
         return UserSerializer(user).data
 
     def get_to_user(self, obj):
-        user = UserService.get_user_in_memcached(obj.to_user_id)
+        user = MemcachedHelper.get_prefetched_object(self.context, User, obj.to_user_id)
         return UserSerializer(user).data
 
     def get_created_at(self, obj):
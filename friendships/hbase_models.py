@@ -23,3 +23,16 @@ class HBaseToUser(models.HBaseModel):
     class Meta:
         table_name = 'twitter_to_users'
         row_key = ('to_user_id', 'created_at')
+
+
+class HBaseFriendshipEdge(models.HBaseModel):
+    # index of friendship, point lookup by (from_user_id, to_user_id)
+    # row key
+    from_user_id = models.IntegerField(reverse=True)
+    to_user_id = models.IntegerField()
+    # column key
+    created_at = models.TimestampField(column_family='cf')
+
+    class Meta:
+        table_name = 'twitter_friendship_edges'
+        row_key = ('from_user_id', 'to_user_id')
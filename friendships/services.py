@@ -1,9 +1,15 @@
-from friendships.hbase_models import HBaseFromUser, HBaseToUser
+from friendships.hbase_models import HBaseFromUser, HBaseToUser, HBaseFriendshipEdge
 from friendships.models import Friendship
+from django.conf import settings
+from utils import helpers
 from utils.gatekeeper.models import GateKeeper
-from utils.memcached.memcached_helper import TO_USERS_PATTERN, project_memcached
+from utils.hbase.models import HBaseBatch
+from utils.memcached.memcached_helper import TO_USERS_OVERFLOW, TO_USERS_PATTERN, project_memcached
 import time
 
+REPAIR_BATCH_SIZE = 1000
+REPAIR_GRACE_PERIOD = 600  # in seconds
+
 
 class FriendshipService:
 
@@ -23,6 +29,21 @@ class FriendshipService:
                 friendships = HBaseToUser.filter(prefix=(to_user_id, ))
         return friendships
 
+    @classmethod
+    def iter_friendships(cls, from_user_id=None, to_user_id=None):
+        # streaming version of get_friendships, for fan out of users with huge followers
+        if not GateKeeper.is_switch_on('switch_friendship_to_hbase'):
+            # iterate from mysql
+            if from_user_id:
+                friendships = Friendship.objects.filter(from_user_id=from_user_id)
+            else:
+                friendships = Friendship.objects.filter(to_user_id=to_user_id)
+            return friendships.order_by('-created_at').iterator()
+        # iterate from hbase
+        if from_user_id:
+            return HBaseFromUser.iter_filter(prefix=(from_user_id, ))
+        return HBaseToUser.iter_filter(prefix=(to_user_id, ))
+
     @classmethod
     def follow(cls, from_user_id, to_user_id):
         # user cannot follow self
@@ -39,18 +60,19 @@ class FriendshipService:
                 to_user_id=to_user_id,
             )
         else:
-            # create in hbase
+            # create in hbase, HBaseFromUser is sent last and marks the friendship as done,
+            # see repair_hbase_friendships
             ts_now = int(time.time() * 1000000)
-            HBaseToUser.create(
-                from_user_id=from_user_id,
-                to_user_id=to_user_id,
-                created_at=ts_now,
-            )
-            return HBaseFromUser.create(
-                from_user_id=from_user_id,
-                to_user_id=to_user_id,
-                created_at=ts_now,
-            )
+            data = {
+                'from_user_id': from_user_id,
+                'to_user_id': to_user_id,
+                'created_at': ts_now,
+            }
+            with HBaseBatch() as batch:
+                batch.create(HBaseToUser, **data)
+                batch.create(HBaseFriendshipEdge, **data)
+                friendship = batch.create(HBaseFromUser, **data)
+            return friendship
 
     @classmethod
     def unfollow(cls, from_user_id, to_user_id):
@@ -69,36 +91,97 @@ class FriendshipService:
             ).delete()
             return deleted
         else:
-            # remove in hbase
-            friendships = HBaseFromUser.filter(prefix=(from_user_id,))
-            for friendship in friendships:
-                if friendship.to_user_id == int(to_user_id):
-                    ts = friendship.created_at
-                    HBaseToUser.delete(
-                        to_user_id=to_user_id,
-                        created_at=ts,
-                    )
-                    HBaseFromUser.delete(
-                        from_user_id=from_user_id,
-                        created_at=ts,
-                    )
-                    return True
-                    
-            return False
+            # remove in hbase, HBaseFromUser is sent first
+            ts = cls.get_followed_at_in_hbase(from_user_id, to_user_id)
+            if ts is None:
+                return False
+
+            with HBaseBatch() as batch:
+                batch.delete(HBaseFromUser, from_user_id=from_user_id, created_at=ts)
+                batch.delete(HBaseToUser, to_user_id=to_user_id, created_at=ts)
+                batch.delete(HBaseFriendshipEdge, from_user_id=from_user_id, to_user_id=to_user_id)
+            return True
+
+    @classmethod
+    def get_followed_at_in_hbase(cls, from_user_id, to_user_id):
+        # point lookup in edge index, edges written before the index or by a half written follow
+        # are missing, they are found by a server side filtered scan and written back
+        edge = HBaseFriendshipEdge.get(from_user_id=from_user_id, to_user_id=to_user_id)
+        if edge:
+            return edge.created_at
+        friendships = HBaseFromUser.filter(
+            prefix=(from_user_id,),
+            filter=HBaseFromUser.column_value_filter('to_user_id', to_user_id),
+            limit=1,
+        )
+        if not friendships:
+            return None
+        HBaseFriendshipEdge.create(**friendships[0].to_dict())
+        return friendships[0].created_at
+
+    @classmethod
+    def repair_hbase_friendships(cls, batch_size=REPAIR_BATCH_SIZE, grace_period=REPAIR_GRACE_PERIOD):
+        """
+        follow writes HBaseToUser, HBaseFriendshipEdge then HBaseFromUser, unfollow deletes
+        HBaseFromUser first, so a friendship exists if and only if its HBaseFromUser row exists.
+        1. HBaseFromUser without HBaseToUser or edge, write the missing rows
+        2. HBaseToUser or edge without HBaseFromUser, delete them
+        rows newer than grace_period (in seconds) may be in flight and are skipped.
+        """
+        max_created_at = int((time.time() - grace_period) * 1000000)
+        repaired = 0
+
+        # 1. half written follow, also backfill edges created before edge index
+        from_users = HBaseFromUser.iter_filter(batch_size=batch_size)
+        for friendships in helpers.chunks(from_users, batch_size):
+            friendships = [fs for fs in friendships if fs.created_at <= max_created_at]
+            to_users = HBaseToUser.get_many([
+                {'to_user_id': fs.to_user_id, 'created_at': fs.created_at}
+                for fs in friendships
+            ])
+            edges = HBaseFriendshipEdge.get_many([
+                {'from_user_id': fs.from_user_id, 'to_user_id': fs.to_user_id}
+                for fs in friendships
+            ])
+            with HBaseBatch() as batch:
+                for friendship, to_user, edge in zip(friendships, to_users, edges):
+                    if to_user is None:
+                        batch.create(HBaseToUser, **friendship.to_dict())
+                        repaired += 1
+                    if edge is None:
+                        batch.create(HBaseFriendshipEdge, **friendship.to_dict())
+                        repaired += 1
+
+        # 2. half written follow or half done unfollow
+        for model_class in (HBaseToUser, HBaseFriendshipEdge):
+            rows = model_class.iter_filter(batch_size=batch_size)
+            for friendships in helpers.chunks(rows, batch_size):
+                friendships = [fs for fs in friendships if fs.created_at <= max_created_at]
+                from_users = HBaseFromUser.get_many([
+                    {'from_user_id': fs.from_user_id, 'created_at': fs.created_at}
+                    for fs in friendships
+                ])
+                with HBaseBatch() as batch:
+                    for friendship, from_user in zip(friendships, from_users):
+                        if from_user is None:
+                            batch.delete(model_class, **friendship.to_dict())
+                            repaired += 1
+        return repaired
 
     @classmethod
     def get_to_users_in_memcached(cls, from_user_id):
+        # in hbase mode, TO_USERS_OVERFLOW is returned for who follows too many users
         key = TO_USERS_PATTERN.format(from_user_id=from_user_id)
         to_users = project_memcached.get(key)
-        if to_users is not None:
+        if GateKeeper.is_switch_on('switch_friendship_to_hbase'):
+            if to_users is None:
+                to_users = cls._load_to_users_in_hbase(from_user_id, limit=settings.MEMCACHED_TO_USERS_LIMIT)
             return to_users
 
-        if not GateKeeper.is_switch_on('switch_friendship_to_hbase'):
-            # get from mysql
-            friendships = Friendship.objects.filter(from_user_id=from_user_id)
-        else:
-            # get from hbase
-            friendships = HBaseFromUser.filter(prefix=(from_user_id,))
+        # overflow marker may be left by hbase mode, all to_users are loaded from mysql
+        if to_users is not None and to_users != TO_USERS_OVERFLOW:
+            return to_users
+        friendships = Friendship.objects.filter(from_user_id=from_user_id)
         to_users = set([
             fs.to_user_id
             for fs in friendships
@@ -108,7 +191,23 @@ class FriendshipService:
 
     @classmethod
     def has_followed(cls, from_user_id, to_user_id):
-        return int(to_user_id) in cls.get_to_users_in_memcached(from_user_id)
+        # use cached to_users, in hbase mode it is filled for who follows not too many users,
+        # otherwise overflow marker is cached and followed is a point lookup in hbase
+        to_users = cls.get_to_users_in_memcached(from_user_id)
+        if to_users != TO_USERS_OVERFLOW:
+            return int(to_user_id) in to_users
+        return cls.get_followed_at_in_hbase(from_user_id, to_user_id) is not None
+
+    @classmethod
+    def _load_to_users_in_hbase(cls, from_user_id, limit):
+        # => cached set of to_user_ids, TO_USERS_OVERFLOW if from user follows more than limit users
+        friendships = HBaseFromUser.filter(prefix=(from_user_id,), columns=('to_user_id',), limit=limit + 1)
+        if len(friendships) > limit:
+            to_users = TO_USERS_OVERFLOW
+        else:
+            to_users = set(fs.to_user_id for fs in friendships)
+        project_memcached.set(TO_USERS_PATTERN.format(from_user_id=from_user_id), to_users)
+        return to_users
 
     @classmethod
     def invalidate_to_users_in_memcached(cls, from_user_id):
@@ -0,0 +1,10 @@
+from celery import shared_task
+from friendships.services import FriendshipService
+
+REPAIR_TIME_LIMIT = 6 * 3600  # 6 hours
+
+
+@shared_task(routing_key='default', time_limit=REPAIR_TIME_LIMIT)
+def repair_hbase_friendships_task():
+    repaired = FriendshipService.repair_hbase_friendships()
+    return f'{repaired} friendship rows repaired.'
@@ -1,12 +1,34 @@
+from django.conf import settings
 from django.test import TestCase
-from friendships.hbase_models import HBaseFromUser, HBaseToUser
+from django.test.utils import override_settings
+from friendships.hbase_models import HBaseFromUser, HBaseToUser, HBaseFriendshipEdge
 from friendships.models import Friendship
 from friendships.services import FriendshipService
 from utils.test_helpers import TestHelpers
+from newsfeeds.hbase_models import HBaseNewsFeed
+from utils.hbase import models
+from utils.hbase.hbase_client import HBaseClient
+from utils.hbase.migrate import migrate_table
+from utils.hbase.models import HBaseBatch, filters
+from utils.hbase.models.codecs import BinaryCodec
 from utils.hbase.models.exceptions import EmptyColumnError, BadRowKeyError
+from utils.memcached.memcached_helper import TO_USERS_OVERFLOW, TO_USERS_PATTERN, project_memcached
+from unittest import skipIf
 import time
 
 
+class HBaseBinaryFromUser(models.HBaseModel):
+    # same fields as HBaseFromUser, row key and columns are encoded by binary codec
+    from_user_id = models.IntegerField(reverse=True)
+    created_at = models.TimestampField()
+    to_user_id = models.IntegerField(column_family='cf')
+
+    class Meta:
+        table_name = 'twitter_binary_from_users'
+        row_key = ('from_user_id', 'created_at')
+        codec = 'binary'
+
+
 class FriendshipServiceTests(TestCase):
 
     def setUp(self):
@@ -27,6 +49,73 @@ class FriendshipServiceTests(TestCase):
         to_users = FriendshipService.get_to_users_in_memcached(self.user1.id)
         self.assertSetEqual(to_users, {self.user3.id, self.user4.id})
 
+    def test_has_followed_and_unfollow_by_edge(self):
+        TestHelpers.create_friendship(from_user=self.user1, to_user=self.user2)
+        edge = HBaseFriendshipEdge.get(from_user_id=self.user1.id, to_user_id=self.user2.id)
+        self.assertIsNotNone(edge)
+
+        # to_users are cached for who follows not too many users
+        self.assertTrue(FriendshipService.has_followed(self.user1.id, self.user2.id))
+        self.assertFalse(FriendshipService.has_followed(self.user1.id, self.user3.id))
+        to_users = project_memcached.get(TO_USERS_PATTERN.format(from_user_id=self.user1.id))
+        self.assertEqual(to_users, {self.user2.id})
+
+        # point lookup for who follows more users
+        FriendshipService.invalidate_to_users_in_memcached(self.user1.id)
+        with override_settings(MEMCACHED_TO_USERS_LIMIT=0):
+            self.assertTrue(FriendshipService.has_followed(self.user1.id, self.user2.id))
+            self.assertFalse(FriendshipService.has_followed(self.user1.id, self.user3.id))
+        key = TO_USERS_PATTERN.format(from_user_id=self.user1.id)
+        self.assertEqual(project_memcached.get(key), TO_USERS_OVERFLOW)
+        # overflow marker is kept
+        self.assertEqual(FriendshipService.get_to_users_in_memcached(self.user1.id), TO_USERS_OVERFLOW)
+        self.assertEqual(project_memcached.get(key), TO_USERS_OVERFLOW)
+
+        self.assertTrue(FriendshipService.unfollow(self.user1.id, self.user2.id))
+        self.assertIsNone(HBaseFriendshipEdge.get(from_user_id=self.user1.id, to_user_id=self.user2.id))
+        self.assertEqual(HBaseFromUser.filter(prefix=(self.user1.id,)), [])
+        self.assertEqual(HBaseToUser.filter(prefix=(self.user2.id,)), [])
+        self.assertFalse(FriendshipService.has_followed(self.user1.id, self.user2.id))
+        self.assertFalse(FriendshipService.unfollow(self.user1.id, self.user2.id))
+
+        # friendship without edge index is found by filtered scan, and its edge is written back
+        ts = int(time.time() * 1000000)
+        HBaseFromUser.create(from_user_id=self.user1.id, to_user_id=self.user3.id, created_at=ts)
+        HBaseToUser.create(from_user_id=self.user1.id, to_user_id=self.user3.id, created_at=ts)
+        self.assertEqual(FriendshipService.get_followed_at_in_hbase(self.user1.id, self.user3.id), ts)
+        self.assertEqual(HBaseFriendshipEdge.get(from_user_id=self.user1.id, to_user_id=self.user3.id).created_at, ts)
+        self.assertTrue(FriendshipService.unfollow(self.user1.id, self.user3.id))
+        self.assertEqual(HBaseFromUser.filter(prefix=(self.user1.id,)), [])
+        self.assertEqual(HBaseToUser.filter(prefix=(self.user3.id,)), [])
+        self.assertIsNone(HBaseFriendshipEdge.get(from_user_id=self.user1.id, to_user_id=self.user3.id))
+
+    def test_repair_hbase_friendships(self):
+        ts = int(time.time() * 1000000)
+        # half written follow, only HBaseFromUser was written
+        HBaseFromUser.create(from_user_id=self.user1.id, to_user_id=self.user2.id, created_at=ts)
+        # half written follow, HBaseFromUser was not written
+        HBaseToUser.create(from_user_id=self.user1.id, to_user_id=self.user3.id, created_at=ts)
+        HBaseFriendshipEdge.create(from_user_id=self.user1.id, to_user_id=self.user3.id, created_at=ts)
+        # complete friendship
+        TestHelpers.create_friendship(from_user=self.user1, to_user=self.user4)
+
+        repaired = FriendshipService.repair_hbase_friendships(grace_period=0)
+        self.assertEqual(repaired, 4)
+        self.assertEqual(len(HBaseToUser.filter(prefix=(self.user2.id,))), 1)
+        self.assertIsNotNone(HBaseFriendshipEdge.get(from_user_id=self.user1.id, to_user_id=self.user2.id))
+        self.assertEqual(HBaseToUser.filter(prefix=(self.user3.id,)), [])
+        self.assertIsNone(HBaseFriendshipEdge.get(from_user_id=self.user1.id, to_user_id=self.user3.id))
+        self.assertEqual(len(HBaseToUser.filter(prefix=(self.user4.id,))), 1)
+
+        # nothing to repair
+        self.assertEqual(FriendshipService.repair_hbase_friendships(grace_period=0), 0)
+
+        # new rows may be in flight
+        HBaseToUser.create(from_user_id=self.user1.id, to_user_id=self.user3.id, created_at=self.user1.id)
+        HBaseToUser.create(from_user_id=self.user2.id, to_user_id=self.user3.id, created_at=int(time.time() * 1000000))
+        self.assertEqual(FriendshipService.repair_hbase_friendships(), 1)
+        self.assertEqual(len(HBaseToUser.filter(prefix=(self.user3.id,))), 1)
+
 
 class FriendshipsHBaseTests(TestCase):
 
@@ -58,6 +147,23 @@ class FriendshipsHBaseTests(TestCase):
         instance = HBaseFromUser.get(from_user_id=123, created_at=self.ts_now)
         self.assertIsNone(instance)
 
+    def test_get_many(self):
+        ts1, ts2 = self.ts_now, self.ts_now + 1
+        HBaseFromUser.create(from_user_id=1, to_user_id=2, created_at=ts1)
+        HBaseFromUser.create(from_user_id=1, to_user_id=3, created_at=ts2)
+
+        instances = HBaseFromUser.get_many([
+            {'from_user_id': 1, 'created_at': ts2},
+            {'from_user_id': 2, 'created_at': ts1},
+            {'from_user_id': 1, 'created_at': ts1},
+        ])
+        self.assertEqual(len(instances), 3)
+        self.assertEqual(instances[0].to_user_id, 3)
+        self.assertIsNone(instances[1])
+        self.assertEqual(instances[2].to_user_id, 2)
+
+        self.assertEqual(HBaseFromUser.get_many([]), [])
+
     def test_create_and_get(self):
         # missing column data by create
         try:
@@ -130,3 +236,185 @@ class FriendshipsHBaseTests(TestCase):
         self.assertEqual(to_users[1].to_user_id, 3)
         self.assertEqual(to_users[2].to_user_id, 2)
 
+    def test_get_table(self):
+        # get_table returns a table to be used without checking out from the pool
+        friendship = HBaseFromUser.create(from_user_id=1, to_user_id=2, created_at=self.ts_now)
+        self.assertTrue(HBaseFromUser.get_table().row(friendship.row_key))
+        with HBaseFromUser.table() as table:
+            self.assertTrue(table.row(friendship.row_key))
+
+    @skipIf(settings.HBASE_BACKEND != 'thrift', 'connection pool is only used by thrift backend')
+    def test_connection_pool(self):
+        with HBaseClient.connection() as conn1:
+            # nested checkout in the same thread reuses the same connection
+            with HBaseClient.connection() as conn2:
+                self.assertIs(conn1, conn2)
+        self.assertIsNotNone(conn1.last_used_at)
+
+        # connection is stamped even if the block raised, so it is health checked later
+        conn1.last_used_at = None
+        with self.assertRaises(ValueError):
+            with HBaseClient.connection() as conn1:
+                raise ValueError()
+        self.assertIsNotNone(conn1.last_used_at)
+
+        # model operations run on pooled connections
+        ts = self.ts_now
+        HBaseFromUser.create(from_user_id=1, to_user_id=2, created_at=ts)
+        instance = HBaseFromUser.get(from_user_id=1, created_at=ts)
+        self.assertEqual(instance.to_user_id, 2)
+
+    def test_iter_filter(self):
+        for to_user_id in range(2, 7):
+            HBaseFromUser.create(from_user_id=1, to_user_id=to_user_id, created_at=self.ts_now)
+
+        # rows are streamed lazily in small scanner batches
+        to_users = HBaseFromUser.iter_filter(prefix=(1,), batch_size=2)
+        self.assertEqual(next(to_users).to_user_id, 2)
+        self.assertEqual([fs.to_user_id for fs in to_users], [3, 4, 5, 6])
+
+        # same result as filter
+        to_users = HBaseFromUser.iter_filter(prefix=(1,), limit=3, reverse=True)
+        self.assertEqual(
+            [fs.to_user_id for fs in to_users],
+            [fs.to_user_id for fs in HBaseFromUser.filter(prefix=(1,), limit=3, reverse=True)],
+        )
+
+    def test_slots(self):
+        ts = self.ts_now
+        friendship = HBaseFromUser(from_user_id=1, to_user_id=2, created_at=ts)
+        # fields are stored in slots, no per instance dict
+        self.assertFalse(hasattr(friendship, '__dict__'))
+        self.assertEqual(friendship.to_dict(), {
+            'from_user_id': 1,
+            'created_at': ts,
+            'to_user_id': 2,
+        })
+        with self.assertRaises(AttributeError):
+            friendship.unknown_field = 1
+
+    def test_binary_codec(self):
+        fields = HBaseFromUser._row_key_fields
+        ts = self.ts_now
+        # 1 byte salt + 8 bytes from_user_id + 8 bytes created_at
+        row_key = BinaryCodec.serialize_row_key(fields, [123, ts])
+        self.assertEqual(len(row_key), 17)
+        self.assertEqual(
+            BinaryCodec.deserialize_row_key(fields, row_key),
+            {'from_user_id': 123, 'created_at': ts},
+        )
+
+        # prefix scan and timestamp order still work
+        prefix = BinaryCodec.serialize_row_key(fields, [123])
+        self.assertTrue(row_key.startswith(prefix))
+        self.assertLess(row_key, BinaryCodec.serialize_row_key(fields, [123, ts + 1]))
+
+        # negative value can not be encoded
+        with self.assertRaises(BadRowKeyError):
+            BinaryCodec.serialize_row_key(fields, [-1, ts])
+
+    def test_binary_codec_model(self):
+        ts = self.ts_now
+        for from_user_id in range(1, 6):
+            for offset in range(3):
+                HBaseBinaryFromUser.create(
+                    from_user_id=from_user_id,
+                    to_user_id=from_user_id * 10 + offset,
+                    created_at=ts + offset,
+                )
+
+        # save and get
+        instance = HBaseBinaryFromUser.get(from_user_id=2, created_at=ts)
+        self.assertEqual(instance.to_dict(), {'from_user_id': 2, 'created_at': ts, 'to_user_id': 20})
+        instance.to_user_id = 99
+        instance.save()
+        self.assertEqual(HBaseBinaryFromUser.get(from_user_id=2, created_at=ts).to_user_id, 99)
+        self.assertIsNone(HBaseBinaryFromUser.get(from_user_id=6, created_at=ts))
+
+        # prefix scan only reads rows of one user, in created_at order
+        to_users = HBaseBinaryFromUser.filter(prefix=(3,))
+        self.assertEqual([fs.to_user_id for fs in to_users], [30, 31, 32])
+        to_users = HBaseBinaryFromUser.filter(prefix=(3,), limit=2, reverse=True)
+        self.assertEqual([fs.to_user_id for fs in to_users], [32, 31])
+
+        # rows of different users are ordered by salt, not by user id
+        from_user_ids = [fs.from_user_id for fs in HBaseBinaryFromUser.filter()]
+        salts = [BinaryCodec.salt(BinaryCodec.packer.pack(user_id)) for user_id in from_user_ids]
+        self.assertEqual(salts, sorted(salts))
+        self.assertEqual(sorted(set(from_user_ids)), [1, 2, 3, 4, 5])
+
+    def test_migrate_table(self):
+        ts = self.ts_now
+        for from_user_id in range(1, 4):
+            for offset in range(2):
+                HBaseFromUser.create(from_user_id=from_user_id, to_user_id=offset, created_at=ts + offset)
+
+        # rows are decoded by string codec and encoded again by binary codec
+        self.assertEqual(migrate_table(HBaseFromUser, HBaseBinaryFromUser, batch_size=4), 6)
+        for from_user_id in range(1, 4):
+            self.assertEqual(
+                [fs.to_dict() for fs in HBaseBinaryFromUser.filter(prefix=(from_user_id,))],
+                [fs.to_dict() for fs in HBaseFromUser.filter(prefix=(from_user_id,))],
+            )
+
+        # models with different fields can not be migrated
+        with self.assertRaises(ValueError):
+            migrate_table(HBaseFromUser, HBaseNewsFeed)
+
+    def test_filter_on_server(self):
+        for to_user_id in [2, 3, 2, 4]:
+            HBaseFromUser.create(from_user_id=1, to_user_id=to_user_id, created_at=self.ts_now)
+
+        # filter by column value
+        to_users = HBaseFromUser.filter(
+            prefix=(1,),
+            filter=HBaseFromUser.column_value_filter('to_user_id', 2),
+        )
+        self.assertEqual([fs.to_user_id for fs in to_users], [2, 2])
+
+        # key only, column values are not transferred
+        to_users = HBaseFromUser.filter(prefix=(1,), filter=filters.key_only_filter())
+        self.assertEqual(len(to_users), 4)
+        self.assertEqual(to_users[0].from_user_id, 1)
+        self.assertIsNone(to_users[0].to_user_id)
+
+        # combined filters
+        to_users = HBaseFromUser.filter(
+            prefix=(1,),
+            filter=filters.and_filters(
+                HBaseFromUser.column_value_filter('to_user_id', 2, op='>'),
+                filters.page_filter(1),
+            ),
+        )
+        self.assertEqual([fs.to_user_id for fs in to_users], [3])
+
+        # column projection
+        to_users = HBaseFromUser.filter(prefix=(1,), columns=('to_user_id',))
+        self.assertEqual(len(to_users), 4)
+        with self.assertRaises(ValueError):
+            HBaseFromUser.filter(prefix=(1,), columns=('created_at',))
+
+    def test_batch(self):
+        ts = self.ts_now
+        with HBaseBatch() as batch:
+            batch.create(HBaseToUser, from_user_id=1, to_user_id=2, created_at=ts)
+            batch.create(HBaseFromUser, from_user_id=1, to_user_id=2, created_at=ts)
+            # nothing is sent before leaving with block
+            self.assertIsNone(HBaseFromUser.get(from_user_id=1, created_at=ts))
+        self.assertIsNotNone(HBaseToUser.get(to_user_id=2, created_at=ts))
+        self.assertIsNotNone(HBaseFromUser.get(from_user_id=1, created_at=ts))
+
+        # nothing is sent if error raised
+        try:
+            with HBaseBatch() as batch:
+                batch.delete(HBaseFromUser, from_user_id=1, created_at=ts)
+                batch.create(HBaseToUser, to_user_id=3, created_at=ts)
+        except EmptyColumnError:
+            pass
+        self.assertIsNotNone(HBaseFromUser.get(from_user_id=1, created_at=ts))
+
+        with HBaseBatch() as batch:
+            batch.delete(HBaseFromUser, from_user_id=1, created_at=ts)
+            batch.delete(HBaseToUser, to_user_id=2, created_at=ts)
+        self.assertIsNone(HBaseToUser.get(to_user_id=2, created_at=ts))
+        self.assertIsNone(HBaseFromUser.get(from_user_id=1, created_at=ts))
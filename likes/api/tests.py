@@ -1,4 +1,12 @@
+from comments.models import Comment
+from django.contrib.auth.models import AnonymousUser
 from django.test import TestCase
+from django.test.utils import override_settings
+from likes.services import LikeServices
+from tweets.models import Tweet
+from tweets.tasks import flush_count_deltas_task
+from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
 from utils.test_helpers import TestHelpers
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -146,6 +154,8 @@ class LikeApiTests(TestCase):
         self.admin_client.post(BASE_LIKE_URL, data)
         response = self.admin_client.get(tweet_url)
         self.assertEqual(response.data['likes_count'], 1)
+        # counts are written to db by flush task
+        flush_count_deltas_task()
         self.tweet.refresh_from_db()
         self.assertEqual(self.tweet.likes_count, 1)
 
@@ -153,6 +163,7 @@ class LikeApiTests(TestCase):
         self.user1_client.post(BASE_LIKE_URL, data)
         response = self.admin_client.get(tweet_url)
         self.assertEqual(response.data['likes_count'], 2)
+        flush_count_deltas_task()
         self.tweet.refresh_from_db()
         self.assertEqual(self.tweet.likes_count, 2)
 
@@ -161,5 +172,90 @@ class LikeApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         response = self.admin_client.get(tweet_url)
         self.assertEqual(response.data['likes_count'], 1)
+        flush_count_deltas_task()
         self.tweet.refresh_from_db()
         self.assertEqual(self.tweet.likes_count, 1)
+
+    def test_liked_object_ids(self):
+        tweet2 = TestHelpers.create_tweet(self.user1)
+        TestHelpers.create_like(self.user1, self.tweet)
+        ids = [self.tweet.id, tweet2.id]
+
+        # cache miss, loaded from db
+        self.assertEqual(LikeServices.get_liked_object_ids(self.user1, Tweet, ids), {self.tweet.id})
+        # cache hit
+        self.assertEqual(LikeServices.get_liked_object_ids(self.user1, Tweet, ids), {self.tweet.id})
+        self.assertEqual(LikeServices.get_liked_object_ids(self.admin, Tweet, ids), set())
+        self.assertEqual(LikeServices.get_liked_object_ids(self.user1, Comment, [self.comment.id]), set())
+        self.assertEqual(LikeServices.get_liked_object_ids(AnonymousUser(), Tweet, ids), set())
+
+        # cached set is updated by like and cancel
+        like = TestHelpers.create_like(self.user1, tweet2)
+        self.assertEqual(LikeServices.get_liked_object_ids(self.user1, Tweet, ids), {self.tweet.id, tweet2.id})
+        like.delete()
+        self.assertEqual(LikeServices.get_liked_object_ids(self.user1, Tweet, ids), {self.tweet.id})
+
+        # too many liked objects to cache, only given ids are checked in db
+        key = LikeServices.get_user_liked_key(self.user1.id, Tweet)
+        RedisClient.get_connection().delete(key)
+        with override_settings(REDIS_USER_LIKED_LIMIT=0):
+            self.assertEqual(LikeServices.get_liked_object_ids(self.user1, Tweet, ids), {self.tweet.id})
+            self.assertEqual(LikeServices.get_liked_object_ids(self.user1, Tweet, [tweet2.id]), set())
+        self.assertEqual(RedisClient.get_connection().smembers(key), {b'', b'*'})
+
+        # has_liked of a page comes from the prefetched context
+        context = {'user': self.user1}
+        LikeServices.prefetch_liked_object_ids(context, Tweet, ids)
+        self.assertEqual(LikeServices.has_liked_in_context(context, self.tweet), True)
+        self.assertEqual(LikeServices.has_liked_in_context(context, tweet2), False)
+
+    def test_has_liked_in_redis(self):
+        # cache miss, likers loaded from db
+        self.assertEqual(LikeServices.has_liked(self.user1, self.tweet), False)
+        like = TestHelpers.create_like(self.user1, self.tweet)
+        # cached likers are updated by like and cancel
+        self.assertEqual(LikeServices.has_liked(self.user1, self.tweet), True)
+        self.assertEqual(LikeServices.has_liked(self.admin, self.tweet), False)
+        like.delete()
+        self.assertEqual(LikeServices.has_liked(self.user1, self.tweet), False)
+
+        # likes of comments are cached separately
+        TestHelpers.create_like(self.admin, self.comment)
+        self.assertEqual(LikeServices.has_liked(self.admin, self.comment), True)
+        self.assertEqual(LikeServices.has_liked(self.admin, self.tweet), False)
+        self.assertEqual(LikeServices.has_liked(AnonymousUser(), self.comment), False)
+
+    def test_has_liked_of_hot_object(self):
+        TestHelpers.create_like(self.user1, self.tweet)
+        TestHelpers.create_like(self.admin, self.tweet)
+
+        # too many likers to cache, checked in ids liked by user
+        with override_settings(REDIS_OBJECT_LIKERS_LIMIT=1):
+            self.assertEqual(LikeServices.has_liked(self.user1, self.tweet), True)
+            like = TestHelpers.create_like(TestHelpers.create_user('user2', email='user2@user2.com'), self.tweet)
+            self.assertEqual(LikeServices.has_liked(like.user, self.tweet), True)
+            like.delete()
+            self.assertEqual(LikeServices.has_liked(like.user, self.tweet), False)
+        key = LikeServices.get_object_likers_key(Tweet, self.tweet.id)
+        self.assertEqual(RedisClient.get_connection().smembers(key), {b'', b'*'})
+
+        # cached set growing over limit is cached as overflowed
+        tweet2 = TestHelpers.create_tweet(self.user1)
+        self.assertEqual(LikeServices.has_liked(self.user1, tweet2), False)
+        with override_settings(REDIS_OBJECT_LIKERS_LIMIT=1):
+            TestHelpers.create_like(self.user1, tweet2)
+            TestHelpers.create_like(self.admin, tweet2)
+            self.assertEqual(LikeServices.has_liked(self.admin, tweet2), True)
+        key = LikeServices.get_object_likers_key(Tweet, tweet2.id)
+        self.assertEqual(RedisClient.get_connection().smembers(key), {b'', b'*'})
+
+    def test_like_while_loading_likers(self):
+        key = LikeServices.get_object_likers_key(Tweet, self.tweet.id)
+
+        # like committed after likers are read from db is applied by the load
+        def load_members():
+            TestHelpers.create_like(self.user1, self.tweet)
+            return []
+
+        self.assertEqual(RedisHelper.get_members_in_redis(key, [str(self.user1.id)], load_members), set())
+        self.assertEqual(LikeServices.has_liked(self.user1, self.tweet), True)
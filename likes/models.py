@@ -2,7 +2,7 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db.models.signals import pre_delete, post_save
+from django.db.models.signals import post_delete, pre_delete, post_save
 from utils.memcached.memcached_helper import MemcachedHelper
 from utils.redis.redis_helper import RedisHelper
 
@@ -31,41 +31,37 @@ class Like(models.Model):
 def incr_likes_count_in_redis(sender, instance, created, **kwargs):
     from tweets.models import Tweet
     from comments.models import Comment
-    from django.db.models import F
 
     if not created:
         return
 
-    if isinstance(instance.content_object, Tweet):
-        Tweet.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') + 1
-        )
-        RedisHelper.incr_count_in_redis(instance.content_object, 'likes_count')
-
-    if isinstance(instance.content_object, Comment):
-        Tweet.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') + 1
-        )
+    # write behind, db is updated by tweets.tasks.flush_count_deltas_task
+    if isinstance(instance.content_object, (Tweet, Comment)):
         RedisHelper.incr_count_in_redis(instance.content_object, 'likes_count')
 
 def decr_likes_count_in_redis(sender, instance, **kwargs):
     from tweets.models import Tweet
     from comments.models import Comment
-    from django.db.models import F
 
-    if isinstance(instance.content_object, Tweet):
-        Tweet.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') - 1
-        )
+    if isinstance(instance.content_object, (Tweet, Comment)):
         RedisHelper.decr_count_in_redis(instance.content_object, 'likes_count')
 
-    if isinstance(instance.content_object, Comment):
-        Tweet.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') - 1
-        )
-        RedisHelper.decr_count_in_redis(instance.content_object, 'likes_count')
+def add_like_in_redis(sender, instance, created, **kwargs):
+    from likes.services import LikeServices
+
+    if not created:
+        return
+    LikeServices.add_like_in_redis(instance)
+
+def remove_like_in_redis(sender, instance, **kwargs):
+    from likes.services import LikeServices
+
+    LikeServices.remove_like_in_redis(instance)
 
 
 # redis
 post_save.connect(incr_likes_count_in_redis, sender=Like)
-pre_delete.connect(decr_likes_count_in_redis, sender=Like)
\ No newline at end of file
+pre_delete.connect(decr_likes_count_in_redis, sender=Like)
+post_save.connect(add_like_in_redis, sender=Like)
+# removed after the like is deleted, a failed delete keeps the cached set correct
+post_delete.connect(remove_like_in_redis, sender=Like)
\ No newline at end of file
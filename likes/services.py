@@ -1,15 +1,110 @@
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from likes.models import Like
+from utils.redis.redis_helper import RedisHelper, OBJECT_LIKERS_PATTERN, USER_LIKED_PATTERN
+
+# key in serializer context, {model class: {object id: has liked}}
+LIKED_OBJECT_IDS = 'liked_object_ids'
 
 
 class LikeServices:
-    
+
     @classmethod
     def has_liked(cls, user, target):
+        """
+        users liked an object are cached in one redis set per object,
+        loaded from db by one query on cache miss. objects with more than
+        REDIS_OBJECT_LIKERS_LIMIT likers are not cached, ids liked by user are checked instead
+        """
         if user.is_anonymous:
             return False
-        return Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(target.__class__),
-            object_id=target.id,
-            user=user,
-        ).exists()
\ No newline at end of file
+        content_type = ContentType.objects.get_for_model(target.__class__)
+        limit = settings.REDIS_OBJECT_LIKERS_LIMIT
+        likers = RedisHelper.get_members_in_redis(
+            cls.get_object_likers_key(target.__class__, target.id),
+            [str(user.id)],
+            lambda: [
+                str(user_id)
+                for user_id in Like.objects.filter(
+                    content_type=content_type,
+                    object_id=target.id,
+                    user_id__isnull=False,
+                ).values_list('user_id', flat=True)[:limit + 1]
+            ],
+            limit=limit,
+        )
+        if likers is None:
+            return target.id in cls.get_liked_object_ids(user, target.__class__, [target.id])
+        return bool(likers)
+
+    @classmethod
+    def get_user_liked_key(cls, user_id, model_class):
+        return USER_LIKED_PATTERN.format(model_name=model_class.__name__, user_id=user_id)
+
+    @classmethod
+    def get_object_likers_key(cls, model_class, object_id):
+        return OBJECT_LIKERS_PATTERN.format(model_name=model_class.__name__, object_id=object_id)
+
+    @classmethod
+    def get_liked_object_ids(cls, user, model_class, object_ids):
+        """
+        => set of object ids liked by user, ids liked by user are cached in one redis set
+        per user and model, loaded from db by one query on cache miss. for users liked more than
+        REDIS_USER_LIKED_LIMIT objects, only the given ids are checked in db
+        """
+        if user.is_anonymous:
+            return set()
+        content_type = ContentType.objects.get_for_model(model_class)
+        likes = Like.objects.filter(user_id=user.id, content_type=content_type)
+        limit = settings.REDIS_USER_LIKED_LIMIT
+        liked_object_ids = RedisHelper.get_members_in_redis(
+            cls.get_user_liked_key(user.id, model_class),
+            [str(object_id) for object_id in object_ids],
+            lambda: [str(object_id) for object_id in likes.values_list('object_id', flat=True)[:limit + 1]],
+            limit=limit,
+        )
+        if liked_object_ids is None:
+            return set(likes.filter(object_id__in=object_ids).values_list('object_id', flat=True))
+        return {int(object_id) for object_id in liked_object_ids}
+
+    @classmethod
+    def prefetch_liked_object_ids(cls, context, model_class, object_ids):
+        # has liked of each object read by has_liked_in_context
+        prefetched = context.setdefault(LIKED_OBJECT_IDS, {}).setdefault(model_class, {})
+        object_ids = {object_id for object_id in object_ids if object_id not in prefetched}
+        liked_object_ids = cls.get_liked_object_ids(context['user'], model_class, object_ids)
+        prefetched.update({object_id: object_id in liked_object_ids for object_id in object_ids})
+        return prefetched
+
+    @classmethod
+    def has_liked_in_context(cls, context, target):
+        prefetched = context.get(LIKED_OBJECT_IDS, {}).get(target.__class__, {})
+        if target.id in prefetched:
+            return prefetched[target.id]
+        return cls.has_liked(context['user'], target)
+
+    @classmethod
+    def add_like_in_redis(cls, like):
+        # sets not cached are loaded with the like on next read, or by a load running meanwhile
+        # from the journal of the set
+        if like.user_id is None:
+            return
+        model_class = ContentType.objects.get_for_id(like.content_type_id).model_class()
+        RedisHelper.add_member_in_redis(
+            cls.get_user_liked_key(like.user_id, model_class),
+            like.object_id,
+            limit=settings.REDIS_USER_LIKED_LIMIT,
+        )
+        RedisHelper.add_member_in_redis(
+            cls.get_object_likers_key(model_class, like.object_id),
+            like.user_id,
+            limit=settings.REDIS_OBJECT_LIKERS_LIMIT,
+        )
+
+    @classmethod
+    def remove_like_in_redis(cls, like):
+        if like.user_id is None:
+            return
+        model_class = ContentType.objects.get_for_id(like.content_type_id).model_class()
+        RedisHelper.remove_member_in_redis(cls.get_user_liked_key(like.user_id, model_class), like.object_id)
+        RedisHelper.remove_member_in_redis(cls.get_object_likers_key(model_class, like.object_id), like.user_id)
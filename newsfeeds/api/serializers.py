@@ -1,5 +1,29 @@
+from accounts.services import UserService
+from likes.services import LikeServices
 from rest_framework import serializers
 from tweets.api.serializers import TweetSerializer
+from tweets.models import Tweet
+from utils.memcached.memcached_helper import MemcachedHelper
+from utils.redis.redis_helper import RedisHelper
+
+
+class NewsFeedListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # tweets of the whole page, their users, likes and counts are loaded in one batch
+        newsfeeds = list(data)
+        tweets = MemcachedHelper.prefetch_objects_in_memcached(
+            self.context,
+            Tweet,
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+        )
+        UserService.prefetch_users_in_memcached(
+            self.context,
+            [tweet.user_id for tweet in tweets.values()],
+            with_profile=True,
+        )
+        LikeServices.prefetch_liked_object_ids(self.context, Tweet, list(tweets))
+        RedisHelper.prefetch_counts_in_redis(self.context, Tweet, list(tweets), ('likes_count', 'comments_count'))
+        return super().to_representation(newsfeeds)
 
 
 class NewsFeedSerializer(serializers.Serializer):
@@ -7,6 +31,9 @@ class NewsFeedSerializer(serializers.Serializer):
     tweet = serializers.SerializerMethodField()
     created_at = serializers.SerializerMethodField()
 
+    class Meta:
+        list_serializer_class = NewsFeedListSerializer
+
     def update(self):
         pass
 
@@ -17,7 +44,8 @@ class NewsFeedSerializer(serializers.Serializer):
         return obj.id
 
     def get_tweet(self, obj):
-        return TweetSerializer(obj.cached_tweet, context=self.context).data
+        tweet = MemcachedHelper.get_prefetched_object(self.context, Tweet, obj.tweet_id)
+        return TweetSerializer(tweet, context=self.context).data
 
     def get_created_at(self, obj):
         return obj.created_at
@@ -15,8 +15,10 @@ class NewsFeedViewSet(viewsets.GenericViewSet):
 
     @rate_limit(hms=(0, 6, 0))
     def list(self, request):
-        cached_newsfeeds = NewsFeedService.get_newsfeeds_in_redis(request.user.id)
-        page = self.paginator.paginate_cached_list(request, cached_newsfeeds)
+        page = self.paginator.paginate_cached_page(
+            request,
+            lambda **kwargs: NewsFeedService.get_newsfeeds_page_in_redis(request.user.id, **kwargs),
+        )
         if page is None:
             if not GateKeeper.is_switch_on('switch_newsfeed_to_hbase'):
                 # pagination in mysql
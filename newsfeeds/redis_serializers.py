@@ -0,0 +1,37 @@
+from newsfeeds.hbase_models import HBaseNewsFeed
+from newsfeeds.models import NewsFeed
+from utils.redis.redis_serializers import PackedFieldsSerializer, StructModelSerializer
+
+
+class NewsFeedIdSerializer(PackedFieldsSerializer):
+    # newsfeed is rebuilt from its ids, tweets of the page are prefetched by NewsFeedListSerializer
+    model_class = NewsFeed
+    fields = ('created_at', 'id', 'tweet_id', 'user_id')
+
+
+class HBaseNewsFeedIdSerializer(NewsFeedIdSerializer):
+    # created_at of hbase newsfeed is already a timestamp
+    model_class = HBaseNewsFeed
+    fields = ('created_at', 'tweet_id', 'user_id')
+    datetime_fields = ()
+
+
+class NewsFeedStructSerializer(StructModelSerializer):
+    model_class = NewsFeed
+    version = 1
+    fields = (
+        ('id', 'int'),
+        ('created_at', 'datetime'),
+        ('tweet_id', 'int'),
+        ('user_id', 'int'),
+    )
+
+
+class HBaseNewsFeedStructSerializer(StructModelSerializer):
+    model_class = HBaseNewsFeed
+    version = 1
+    fields = (
+        ('user_id', 'int'),
+        ('created_at', 'int'),
+        ('tweet_id', 'int'),
+    )
@@ -1,8 +1,22 @@
+from django.conf import settings
 from newsfeeds.hbase_models import HBaseNewsFeed
 from newsfeeds.models import NewsFeed
 from newsfeeds.tasks import fan_out_main_task
 from utils.gatekeeper.models import GateKeeper
-from utils.redis.redis_helper import RedisHelper, USER_NEWSFEEDS_PATTERN
+from newsfeeds.redis_serializers import (
+    HBaseNewsFeedIdSerializer,
+    HBaseNewsFeedStructSerializer,
+    NewsFeedIdSerializer,
+    NewsFeedStructSerializer,
+)
+from utils.redis.redis_helper import (
+    RedisHelper,
+    ID_ENTRIES,
+    STRUCT_SERIALIZER,
+    USER_NEWSFEEDS_PATTERN,
+    USER_NEWSFEEDS_ZSET_PATTERN,
+)
+from utils.redis.redis_serializers import DjangoModelSerializer, HBaseModelSerializer
 
 
 class NewsFeedService:
@@ -36,13 +50,35 @@ class NewsFeedService:
     def fan_out(cls, tweet):
         fan_out_main_task.delay(tweet.id, tweet.user_id, tweet.timestamp)
 
+    @classmethod
+    def get_redis_timeline(cls, user_id, hbase=False):
+        # => kwargs of RedisHelper timeline methods
+        store = settings.REDIS_TIMELINE_STORES['newsfeeds']
+        if settings.REDIS_TIMELINE_ENTRIES['newsfeeds'] == ID_ENTRIES:
+            serializer = HBaseNewsFeedIdSerializer if hbase else NewsFeedIdSerializer
+        elif settings.REDIS_OBJECT_SERIALIZER == STRUCT_SERIALIZER:
+            serializer = HBaseNewsFeedStructSerializer if hbase else NewsFeedStructSerializer
+        else:
+            serializer = HBaseModelSerializer if hbase else DjangoModelSerializer
+        return {
+            'key': RedisHelper.get_timeline_key(
+                USER_NEWSFEEDS_PATTERN,
+                USER_NEWSFEEDS_ZSET_PATTERN,
+                store,
+                serializer,
+                user_id=user_id,
+            ),
+            'store': store,
+            'serializer': serializer,
+        }
+
     @classmethod
     def get_newsfeeds_in_redis(cls, user_id):
-        key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
         if not GateKeeper.is_switch_on('switch_newsfeed_to_hbase'):
             # get objects in mysql
             queryset = NewsFeed.objects.filter(user_id=user_id).order_by('-created_at')
-            return RedisHelper.get_objects_in_redis_from_sql(key, queryset)
+            timeline = cls.get_redis_timeline(user_id)
+            return RedisHelper.get_objects_in_redis_from_sql(queryset=queryset, **timeline)
         else:
             # get objects in HBase
             query_func = lambda limit: HBaseNewsFeed.filter(
@@ -50,15 +86,33 @@ class NewsFeedService:
                 limit=limit, 
                 reverse=True
             )
-            return RedisHelper.get_objects_in_redis_from_hbase(key, query_func)
+            timeline = cls.get_redis_timeline(user_id, hbase=True)
+            return RedisHelper.get_objects_in_redis_from_hbase(query_func=query_func, **timeline)
+
+    @classmethod
+    def get_newsfeeds_page_in_redis(cls, user_id, **kwargs):
+        if not GateKeeper.is_switch_on('switch_newsfeed_to_hbase'):
+            # get objects in mysql
+            queryset = NewsFeed.objects.filter(user_id=user_id).order_by('-created_at')
+            timeline = cls.get_redis_timeline(user_id)
+            return RedisHelper.get_page_in_redis_from_sql(queryset=queryset, **timeline, **kwargs)
+        else:
+            # get objects in HBase
+            query_func = lambda limit: HBaseNewsFeed.filter(
+                prefix=(user_id, None),
+                limit=limit,
+                reverse=True
+            )
+            timeline = cls.get_redis_timeline(user_id, hbase=True)
+            return RedisHelper.get_page_in_redis_from_hbase(query_func=query_func, **timeline, **kwargs)
 
     @classmethod
     def extend_newsfeed_in_redis(cls, newsfeed):
-        key = USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id)
         if not GateKeeper.is_switch_on('switch_newsfeed_to_hbase'):
             # get object in mysql
             queryset = NewsFeed.objects.filter(user_id=newsfeed.user_id).order_by('-created_at')
-            RedisHelper.extend_object_in_redis_from_sql(key, newsfeed, queryset)
+            timeline = cls.get_redis_timeline(newsfeed.user_id)
+            RedisHelper.extend_object_in_redis_from_sql(obj=newsfeed, queryset=queryset, **timeline)
         else:
             # get object in HBase
             query_func = lambda limit: HBaseNewsFeed.filter(
@@ -66,4 +120,5 @@ class NewsFeedService:
                 limit=limit, 
                 reverse=True,
             )
-            return RedisHelper.extend_object_in_redis_from_hbase(key, newsfeed, query_func)
\ No newline at end of file
+            timeline = cls.get_redis_timeline(newsfeed.user_id, hbase=True)
+            return RedisHelper.extend_object_in_redis_from_hbase(obj=newsfeed, query_func=query_func, **timeline)
\ No newline at end of file
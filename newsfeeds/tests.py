@@ -1,8 +1,10 @@
 from django.test import TestCase
 from newsfeeds.hbase_models import HBaseNewsFeed
+from newsfeeds.redis_serializers import HBaseNewsFeedStructSerializer
 from newsfeeds.services import NewsFeedService
 from newsfeeds.tasks import fan_out_main_task
 from rest_framework.test import APIClient
+from utils.redis.redis_client import RedisClient
 from utils.test_helpers import TestHelpers
 import time
 
@@ -29,6 +31,14 @@ class NewsFeedServiceTests(TestCase):
         newsfeeds = [newsfeed.cached_tweet.content for newsfeed in newsfeeds]
         self.assertEqual(newsfeeds, ['tweet2', 'tweet1'])
 
+        # whole newsfeeds are cached by struct serializer
+        timeline = NewsFeedService.get_redis_timeline(self.user1.id, hbase=True)
+        self.assertEqual(timeline['serializer'], HBaseNewsFeedStructSerializer)
+        cached = RedisClient.get_connection().lindex(timeline['key'], 0)
+        newsfeed = HBaseNewsFeedStructSerializer.deserialize(cached)
+        self.assertEqual(newsfeed.user_id, self.user1.id)
+        self.assertEqual(newsfeed.cached_tweet.content, 'tweet2')
+
         # redis hit
         newsfeeds = NewsFeedService.get_newsfeeds_in_redis(self.user1.id)
         newsfeeds = [newsfeed.cached_tweet.content for newsfeed in newsfeeds]
@@ -1,14 +1,36 @@
 from accounts.api.serializers import UserSerializerWithProfile
+from accounts.services import UserService
 from comments.api.serializers import CommentSerializer
+from django.contrib.auth.models import User
 from likes.api.serializers import LikeSerializer
 from likes.services import LikeServices
 from rest_framework import serializers
 from tweets.models import Tweet, TweetPhoto
+from utils.memcached.memcached_helper import MemcachedHelper
 from utils.redis.redis_helper import RedisHelper
 
 
+class TweetListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # users, likes and counts of the whole page are loaded in one batch
+        tweets = list(data)
+        UserService.prefetch_users_in_memcached(
+            self.context,
+            [tweet.user_id for tweet in tweets],
+            with_profile=True,
+        )
+        LikeServices.prefetch_liked_object_ids(self.context, Tweet, [tweet.id for tweet in tweets])
+        RedisHelper.prefetch_counts_in_redis(
+            self.context,
+            Tweet,
+            [tweet.id for tweet in tweets],
+            ('likes_count', 'comments_count'),
+        )
+        return super().to_representation(tweets)
+
+
 class TweetSerializer(serializers.ModelSerializer):
-    user = UserSerializerWithProfile(source='cached_user')
+    user = serializers.SerializerMethodField()
     has_liked = serializers.SerializerMethodField()
     likes_count = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
@@ -26,15 +48,22 @@ class TweetSerializer(serializers.ModelSerializer):
             'comments_count',
             'photo_urls',
         )
+        list_serializer_class = TweetListSerializer
+
+    def get_user(self, obj):
+        user = MemcachedHelper.get_prefetched_object(self.context, User, obj.user_id)
+        if user is None:
+            return None
+        return UserSerializerWithProfile(user, context=self.context).data
 
     def get_has_liked(self, obj):
-        return LikeServices.has_liked(self.context['user'], obj)
+        return LikeServices.has_liked_in_context(self.context, obj)
 
     def get_likes_count(self, obj):
-        return RedisHelper.get_count_in_redis(obj, 'likes_count')
+        return RedisHelper.get_prefetched_count(self.context, obj, 'likes_count')
 
     def get_comments_count(self, obj):
-        return RedisHelper.get_count_in_redis(obj, 'comments_count')
+        return RedisHelper.get_prefetched_count(self.context, obj, 'comments_count')
 
     def get_photo_urls(self, obj):
         return [photo.file.url for photo in obj.tweetphoto_set.all().order_by('order')]
@@ -60,13 +89,13 @@ class TweetSerializerForDetails(TweetSerializer):
         )
 
     def get_has_liked(self, obj):
-        return LikeServices.has_liked(self.context['user'], obj)
+        return LikeServices.has_liked_in_context(self.context, obj)
 
     def get_likes_count(self, obj):
-        return RedisHelper.get_count_in_redis(obj, 'likes_count')
+        return RedisHelper.get_prefetched_count(self.context, obj, 'likes_count')
 
     def get_comments_count(self, obj):
-        return RedisHelper.get_count_in_redis(obj, 'comments_count')
+        return RedisHelper.get_prefetched_count(self.context, obj, 'comments_count')
 
     def get_photo_urls(self, obj):
         return [photo.file.url for photo in obj.tweetphoto_set.all().order_by('order')]
@@ -214,3 +214,14 @@ class TweetApiTests(TestCase):
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['id'], new_tweet.id)
 
+        # deleted tweet is dropped from the cached page, but still counts for the next page
+        tweets[page_size].delete()
+        response = self.user1_client.get(TWEET_LIST_URL, {
+            'created_at__lt': tweets[page_size - 2].created_at,
+            'user_id': self.user1.id,
+        })
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(len(response.data['results']), page_size)
+        self.assertEqual(response.data['results'][0]['id'], tweets[page_size - 1].id)
+        self.assertEqual(response.data['results'][1]['id'], tweets[page_size + 1].id)
+
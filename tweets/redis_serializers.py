@@ -0,0 +1,30 @@
+from tweets.models import Tweet
+from utils.memcached.memcached_helper import MemcachedHelper
+from utils.redis.redis_serializers import PackedFieldsSerializer, StructModelSerializer
+
+
+class TweetIdSerializer(PackedFieldsSerializer):
+    # (created_at, id) of a tweet in 16 bytes, tweets are hydrated from memcached
+    model_class = Tweet
+    fields = ('created_at', 'id')
+
+    @classmethod
+    def hydrate(cls, objects):
+        cached_tweets = MemcachedHelper.get_objects_in_memcached(
+            Tweet,
+            [obj.id for obj in objects],
+        )
+        # deleted tweets are skipped
+        return [cached_tweets[obj.id] for obj in objects if obj.id in cached_tweets]
+
+
+class TweetStructSerializer(StructModelSerializer):
+    # counts are read from redis counts hash, they are not cached with the tweet
+    model_class = Tweet
+    version = 2
+    fields = (
+        ('id', 'int'),
+        ('created_at', 'datetime'),
+        ('user_id', 'int'),
+        ('content', 'str'),
+    )
@@ -1,17 +1,111 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
 from tweets.models import Tweet
-from utils.redis.redis_helper import RedisHelper, USER_TWEETS_PATTERN
+from tweets.redis_serializers import TweetIdSerializer, TweetStructSerializer
+from utils import helpers
+from utils.redis.redis_helper import (
+    RedisHelper,
+    ID_ENTRIES,
+    STRUCT_SERIALIZER,
+    USER_TWEETS_PATTERN,
+    USER_TWEETS_ZSET_PATTERN,
+)
+from utils.redis.redis_serializers import DjangoModelSerializer
 
 
 class TweetService:
 
+    @classmethod
+    def get_redis_timeline(cls, user_id):
+        # => kwargs of RedisHelper timeline methods
+        store = settings.REDIS_TIMELINE_STORES['tweets']
+        if settings.REDIS_TIMELINE_ENTRIES['tweets'] == ID_ENTRIES:
+            serializer = TweetIdSerializer
+        elif settings.REDIS_OBJECT_SERIALIZER == STRUCT_SERIALIZER:
+            serializer = TweetStructSerializer
+        else:
+            serializer = DjangoModelSerializer
+        return {
+            'key': RedisHelper.get_timeline_key(
+                USER_TWEETS_PATTERN,
+                USER_TWEETS_ZSET_PATTERN,
+                store,
+                serializer,
+                user_id=user_id,
+            ),
+            'store': store,
+            'serializer': serializer,
+        }
+
     @classmethod
     def get_tweets_in_redis(cls, user_id):
         queryset = Tweet.objects.filter(user_id=user_id).order_by('-created_at')
-        key = USER_TWEETS_PATTERN.format(user_id=user_id)
-        return RedisHelper.get_objects_in_redis_from_sql(key, queryset)
+        timeline = cls.get_redis_timeline(user_id)
+        return RedisHelper.get_objects_in_redis_from_sql(queryset=queryset, **timeline)
+
+    @classmethod
+    def get_tweets_page_in_redis(cls, user_id, **kwargs):
+        queryset = Tweet.objects.filter(user_id=user_id).order_by('-created_at')
+        timeline = cls.get_redis_timeline(user_id)
+        return RedisHelper.get_page_in_redis_from_sql(queryset=queryset, **timeline, **kwargs)
 
     @classmethod
     def extend_tweet_in_redis(cls, tweet):
         queryset = Tweet.objects.filter(user_id=tweet.user_id).order_by('-created_at')
-        key = USER_TWEETS_PATTERN.format(user_id=tweet.user_id)
-        RedisHelper.extend_object_in_redis_from_sql(key, tweet, queryset)
\ No newline at end of file
+        timeline = cls.get_redis_timeline(tweet.user_id)
+        RedisHelper.extend_object_in_redis_from_sql(obj=tweet, queryset=queryset, **timeline)
+
+    @classmethod
+    def _count_by(cls, queryset, field, ids):
+        # => {id: count}, counted by one group by query
+        return dict(
+            queryset.filter(**{f'{field}__in': ids})
+            .values_list(field)
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+
+    @classmethod
+    def check_counts(cls, days=None):
+        """
+        compare write behind counts of recent tweets and comments with likes and comments in db,
+        repair the drifted ones, => number of counts repaired
+        """
+        from comments.models import Comment
+        from likes.models import Like
+
+        since = helpers.utc_now() - timedelta(days=days or settings.REDIS_COUNT_CHECK_DAYS)
+        batch_size = settings.REDIS_COUNT_FLUSH_BATCH_SIZE
+        repaired = 0
+
+        likes = Like.objects.filter(content_type=ContentType.objects.get_for_model(Tweet))
+
+        def count_tweets(ids):
+            likes_count = cls._count_by(likes, 'object_id', ids)
+            comments_count = cls._count_by(Comment.objects.all(), 'tweet_id', ids)
+            return {
+                tweet_id: {
+                    'likes_count': likes_count.get(tweet_id, 0),
+                    'comments_count': comments_count.get(tweet_id, 0),
+                }
+                for tweet_id in ids
+            }
+
+        tweet_ids = Tweet.objects.filter(created_at__gte=since).order_by('id').values_list('id', flat=True)
+        for ids in helpers.chunks(tweet_ids.iterator(), batch_size):
+            repaired += RedisHelper.check_counts_in_redis(
+                Tweet, ids, ('likes_count', 'comments_count'), count_tweets,
+            )
+
+        comment_likes = Like.objects.filter(content_type=ContentType.objects.get_for_model(Comment))
+
+        def count_comments(ids):
+            likes_count = cls._count_by(comment_likes, 'object_id', ids)
+            return {comment_id: {'likes_count': likes_count.get(comment_id, 0)} for comment_id in ids}
+
+        comment_ids = Comment.objects.filter(created_at__gte=since).order_by('id').values_list('id', flat=True)
+        for ids in helpers.chunks(comment_ids.iterator(), batch_size):
+            repaired += RedisHelper.check_counts_in_redis(Comment, ids, ('likes_count',), count_comments)
+        return repaired
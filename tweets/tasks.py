@@ -0,0 +1,20 @@
+from celery import shared_task
+from tweets.models import Tweet
+from utils.redis.redis_helper import RedisHelper
+
+FLUSH_TIME_LIMIT = 60  # 1 minute
+CHECK_TIME_LIMIT = 3600  # 1 hour
+
+
+@shared_task(routing_key='default', time_limit=FLUSH_TIME_LIMIT)
+def flush_count_deltas_task():
+    from comments.models import Comment
+    flushed = RedisHelper.flush_count_deltas(Tweet) + RedisHelper.flush_count_deltas(Comment)
+    return f'{flushed} count deltas flushed.'
+
+
+@shared_task(routing_key='default', time_limit=CHECK_TIME_LIMIT)
+def check_counts_task():
+    from tweets.services import TweetService
+    repaired = TweetService.check_counts()
+    return f'{repaired} counts repaired.'
@@ -1,9 +1,16 @@
 from django.test import TestCase
-from tweets.models import TweetPhoto
+from django.test.utils import override_settings
+from tweets.models import Tweet, TweetPhoto
+from tweets.redis_serializers import TweetIdSerializer, TweetStructSerializer
 from tweets.services import TweetService
+from tweets.tasks import flush_count_deltas_task
+from utils import helpers
+from utils.memcached.memcached_helper import MemcachedHelper
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
 from utils.redis.redis_serializers import DjangoModelSerializer
 from utils.test_helpers import TestHelpers
+import struct
 
 
 class TweetPhotoTests(TestCase):
@@ -33,6 +40,23 @@ class TweetPhotoTests(TestCase):
         cached_tweet = DjangoModelSerializer.deserialize(data)
         self.assertEqual(self.tweet, cached_tweet)
 
+    def test_struct_serializer(self):
+        self.tweet.content = 'tweet with unicode 推文'
+        data = TweetStructSerializer.serialize(self.tweet)
+        self.assertLess(len(data), len(DjangoModelSerializer.serialize(self.tweet)))
+        cached_tweet = TweetStructSerializer.deserialize(data)
+        self.assertEqual(cached_tweet, self.tweet)
+        for field in ('created_at', 'user_id', 'content'):
+            self.assertEqual(getattr(cached_tweet, field), getattr(self.tweet, field))
+
+        # created_at is packed at a fixed offset, pages are searched by it in redis
+        created_at, = struct.unpack_from('>q', data, TweetStructSerializer.created_at_offset)
+        self.assertEqual(created_at, helpers.datetime_to_timestamp(self.tweet.created_at))
+
+        # data of another schema version is never read
+        with self.assertRaises(ValueError):
+            TweetStructSerializer.deserialize(b'\x01' + data[1:])
+
 
 class TweetServiceTests(TestCase):
 
@@ -62,6 +86,166 @@ class TweetServiceTests(TestCase):
         tweets = TweetService.get_tweets_in_redis(self.user1.id)
         self.assertEqual(tweets, [tweet3, tweet2, tweet1])
 
-
-
-
+    def test_cached_tweet_structs(self):
+        tweet1 = TestHelpers.create_tweet(self.user1, 'tweet1')
+        tweet2 = TestHelpers.create_tweet(self.user1, 'tweet2')
+        entries = {'tweets': 'objects', 'newsfeeds': 'objects'}
+        with override_settings(REDIS_TIMELINE_ENTRIES=entries, REDIS_OBJECT_SERIALIZER='struct'):
+            timeline = TweetService.get_redis_timeline(self.user1.id)
+            self.assertEqual(timeline['serializer'], TweetStructSerializer)
+            # redis miss and hit
+            self.assertEqual(TweetService.get_tweets_in_redis(self.user1.id), [tweet2, tweet1])
+            self.assertEqual(TweetService.get_tweets_in_redis(self.user1.id), [tweet2, tweet1])
+            cached = RedisClient.get_connection().lindex(timeline['key'], 0)
+            self.assertEqual(TweetStructSerializer.deserialize(cached).content, 'tweet2')
+
+            # extend cached timeline
+            tweet3 = TestHelpers.create_tweet(self.user1, 'tweet3')
+            tweets = TweetService.get_tweets_in_redis(self.user1.id)
+            self.assertEqual([tweet.content for tweet in tweets], ['tweet3', 'tweet2', 'tweet1'])
+
+    def test_cached_tweet_ids(self):
+        tweet1 = TestHelpers.create_tweet(self.user1, 'tweet1')
+        tweet2 = TestHelpers.create_tweet(self.user1, 'tweet2')
+        serialized_data = TweetIdSerializer.serialize(tweet1)
+        self.assertEqual(len(serialized_data), 16)
+        entry = TweetIdSerializer.deserialize(serialized_data)
+        self.assertEqual((entry.id, entry.created_at), (tweet1.id, tweet1.created_at))
+
+        # only ids are cached, edited tweet is hydrated from memcached
+        self.assertEqual(TweetService.get_tweets_in_redis(self.user1.id), [tweet2, tweet1])
+        tweet1.content = 'tweet1 edited'
+        tweet1.save()
+        tweets = TweetService.get_tweets_in_redis(self.user1.id)
+        self.assertEqual([tweet.content for tweet in tweets], ['tweet2', 'tweet1 edited'])
+
+        # deleted tweet is skipped
+        tweet2.delete()
+        self.assertEqual(TweetService.get_tweets_in_redis(self.user1.id), [tweet1])
+
+    def test_get_tweets_in_memcached(self):
+        tweets = [TestHelpers.create_tweet(self.user1, f'tweet{i}') for i in range(3)]
+        tweet_ids = [tweet.id for tweet in tweets]
+
+        # misses are loaded by one query, not found object is skipped
+        with self.assertNumQueries(1):
+            cached_tweets = MemcachedHelper.get_objects_in_memcached(Tweet, tweet_ids + [0])
+        self.assertEqual(cached_tweets, {tweet.id: tweet for tweet in tweets})
+
+        # all hit
+        with self.assertNumQueries(0):
+            cached_tweets = MemcachedHelper.get_objects_in_memcached(Tweet, tweet_ids)
+        self.assertEqual(cached_tweets, {tweet.id: tweet for tweet in tweets})
+
+    def test_write_behind_counts(self):
+        tweet = TestHelpers.create_tweet(self.user1)
+        user2 = TestHelpers.create_user('user2', email='user2@user2.com')
+        TestHelpers.create_like(self.user1, tweet)
+        TestHelpers.create_like(user2, tweet)
+        comment = TestHelpers.create_comment(user2, tweet)
+        TestHelpers.create_like(self.user1, comment)
+
+        # counted in redis only
+        self.assertEqual(RedisHelper.get_count_in_redis(tweet, 'likes_count'), 2)
+        tweet.refresh_from_db()
+        self.assertEqual((tweet.likes_count, tweet.comments_count), (0, 0))
+
+        # tweet deltas are not flushed while another worker holds the lock
+        conn = RedisClient.get_connection()
+        conn.set('lock:count_deltas:Tweet', 'other')
+        self.assertEqual(flush_count_deltas_task(), '1 count deltas flushed.')
+        with override_settings(REDIS_COUNT_LOCK_RETRIES=0):
+            self.assertEqual(TweetService.check_counts(), 0)
+        # counts loaded while a flush may be running are not cached
+        counts_key = RedisHelper.get_counts_key(Tweet, tweet.id)
+        conn.delete(counts_key)
+        with override_settings(REDIS_LOCK_WAIT=0):
+            self.assertEqual(RedisHelper.get_count_in_redis(tweet, 'likes_count'), 2)
+            self.assertEqual(RedisHelper.get_counts_in_redis(Tweet, [tweet.id], ['likes_count']), {
+                tweet.id: {'likes_count': 2},
+            })
+        self.assertFalse(conn.exists(counts_key))
+        conn.delete('lock:count_deltas:Tweet')
+
+        # deltas are written to db once
+        self.assertEqual(flush_count_deltas_task(), '2 count deltas flushed.')
+        self.assertEqual(flush_count_deltas_task(), '0 count deltas flushed.')
+        self.assertFalse(conn.exists('lock:count_deltas:Tweet'))
+        tweet.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((tweet.likes_count, tweet.comments_count), (2, 1))
+        self.assertEqual(comment.likes_count, 1)
+
+        # drifted counts are repaired
+        Tweet.objects.filter(id=tweet.id).update(likes_count=5)
+        conn.hset(RedisHelper.get_counts_key(Tweet, tweet.id), 'likes_count', 5)
+        self.assertEqual(TweetService.check_counts(), 1)
+        self.assertEqual(TweetService.check_counts(), 0)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 2)
+        self.assertEqual(RedisHelper.get_count_in_redis(tweet, 'likes_count'), 2)
+
+        # deltas not flushed yet are not drifts
+        TestHelpers.create_comment(self.user1, tweet)
+        self.assertEqual(TweetService.check_counts(), 0)
+        self.assertEqual(flush_count_deltas_task(), '1 count deltas flushed.')
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.comments_count, 2)
+
+    def test_get_counts_in_redis(self):
+        tweets = [TestHelpers.create_tweet(self.user1) for _ in range(3)]
+        TestHelpers.create_like(self.user1, tweets[0])
+        TestHelpers.create_comment(self.user1, tweets[1])
+        tweet_ids = [tweet.id for tweet in tweets]
+        attrs = ('likes_count', 'comments_count')
+        expected = {
+            tweets[0].id: {'likes_count': 1, 'comments_count': 0},
+            tweets[1].id: {'likes_count': 0, 'comments_count': 1},
+            tweets[2].id: {'likes_count': 0, 'comments_count': 0},
+        }
+
+        # misses are loaded by one query, deltas not flushed are counted
+        RedisClient.get_connection().delete(*[RedisHelper.get_counts_key(Tweet, tweet.id) for tweet in tweets])
+        with self.assertNumQueries(1):
+            counts = RedisHelper.get_counts_in_redis(Tweet, tweet_ids + [0], attrs)
+        self.assertEqual(counts, expected)
+
+        # all hit
+        with self.assertNumQueries(0):
+            counts = RedisHelper.get_counts_in_redis(Tweet, tweet_ids, attrs)
+        self.assertEqual(counts, expected)
+
+        # counts are prefetched per attr, deleted objects are counted as 0
+        context = {}
+        RedisHelper.prefetch_counts_in_redis(context, Tweet, tweet_ids, ('likes_count',))
+        deleted_tweet = TestHelpers.create_tweet(self.user1)
+        Tweet.objects.filter(id=deleted_tweet.id).delete()
+        RedisHelper.prefetch_counts_in_redis(context, Tweet, tweet_ids + [deleted_tweet.id], attrs)
+        with self.assertNumQueries(0):
+            self.assertEqual(RedisHelper.get_prefetched_count(context, tweets[0], 'likes_count'), 1)
+            self.assertEqual(RedisHelper.get_prefetched_count(context, tweets[1], 'comments_count'), 1)
+            self.assertEqual(RedisHelper.get_prefetched_count(context, deleted_tweet, 'likes_count'), 0)
+
+        # all counts of a tweet are in one hash
+        conn = RedisClient.get_connection()
+        key = RedisHelper.get_counts_key(Tweet, tweets[0].id)
+        self.assertEqual(conn.hgetall(key), {b'likes_count': b'1', b'comments_count': b'0'})
+
+        # counts cached are kept, expire time is not extended by loading other counts
+        conn.hdel(key, 'comments_count')
+        conn.hset(key, 'likes_count', 5)
+        conn.expire(key, 100)
+        counts = RedisHelper.get_counts_in_redis(Tweet, [tweets[0].id], attrs)
+        self.assertEqual(counts[tweets[0].id], {'likes_count': 5, 'comments_count': 0})
+        self.assertEqual(conn.hget(key, 'comments_count'), b'0')
+        self.assertLessEqual(conn.ttl(key), 100)
+
+    def test_load_count_keeps_object(self):
+        tweet = TestHelpers.create_tweet(self.user1)
+        TestHelpers.create_like(self.user1, tweet)
+        flush_count_deltas_task()
+        RedisClient.get_connection().delete(RedisHelper.get_counts_key(Tweet, tweet.id))
+
+        # tweet may be shared by local cache, loading its count does not change it
+        self.assertEqual(RedisHelper.get_count_in_redis(tweet, 'likes_count'), 1)
+        self.assertEqual(tweet.likes_count, 0)
@@ -70,6 +70,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'utils.middlewares.ReportTimeMiddleware',
+    'utils.middlewares.RequestCacheMiddleware',
 ]
 
 
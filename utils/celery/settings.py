@@ -1,9 +1,11 @@
+from celery.schedules import crontab
 from kombu import Queue
 import sys
 
 print(__name__ + ' loaded.')
 
 # celery -A twitter worker -l INFO
+# celery -A twitter beat -l INFO
 # CELERY_BROKER_URL = 'redis://redis/2' if ((" ".join(sys.argv)).find('manage.py test') != -1) else 'redis://redis/0'
 CELERY_BROKER_URL = 'amqp://guest@rabbitmq'
 CELERY_TIMEZONE = "UTC"
@@ -12,3 +14,17 @@ CELERY_QUEUES = (
     Queue('default', routing_key='default'),
     Queue('newsfeeds', routing_key='newsfeeds'),
 )
+CELERY_BEAT_SCHEDULE = {
+    'repair-hbase-friendships': {
+        'task': 'friendships.tasks.repair_hbase_friendships_task',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'flush-count-deltas': {
+        'task': 'tweets.tasks.flush_count_deltas_task',
+        'schedule': 10.0,  # in seconds
+    },
+    'check-counts': {
+        'task': 'tweets.tasks.check_counts_task',
+        'schedule': crontab(hour=5, minute=0),
+    },
+}
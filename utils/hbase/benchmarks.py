@@ -0,0 +1,96 @@
+"""
+micro benchmarks of HBaseModel, no hbase server needed
+row (de)serialization:
+    python manage.py shell -c "from utils.hbase.benchmarks import run; run()"
+model api on memory backend:
+    python manage.py shell -c "from utils.hbase.benchmarks import run_hbase_path; run_hbase_path()"
+"""
+from django.test.utils import override_settings
+from friendships.hbase_models import HBaseFromUser
+from utils import helpers
+from utils.hbase.hbase_client import HBaseClient
+import time
+import tracemalloc
+
+
+def _rows_per_second(func, rows):
+    start = time.perf_counter()
+    func(rows)
+    return int(len(rows) / (time.perf_counter() - start))
+
+
+def benchmark_serialize(rows):
+    for instance in rows:
+        instance.row_key
+        instance.row_data
+
+
+def benchmark_deserialize(rows):
+    for row_key, row_data in rows:
+        HBaseFromUser.deserialize_row_data(row_key, row_data)
+
+
+def benchmark_memory(size):
+    # bytes allocated per instance
+    ts = int(time.time() * 1000000)
+    tracemalloc.start()
+    instances = [
+        HBaseFromUser(from_user_id=i, to_user_id=i + 1, created_at=ts + i)
+        for i in range(size)
+    ]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current // len(instances)
+
+
+def run(size=100000):
+    ts = int(time.time() * 1000000)
+    instances = [
+        HBaseFromUser(from_user_id=i, to_user_id=i + 1, created_at=ts + i)
+        for i in range(size)
+    ]
+    # row data read from hbase is always bytes
+    scanned_rows = [
+        (
+            instance.row_key,
+            {
+                bytes(key, 'utf-8') if isinstance(key, str) else key: bytes(value, 'utf-8')
+                for key, value in instance.row_data.items()
+            },
+        )
+        for instance in instances
+    ]
+    print(f'serialize: {_rows_per_second(benchmark_serialize, instances)} rows/sec')
+    print(f'deserialize: {_rows_per_second(benchmark_deserialize, scanned_rows)} rows/sec')
+    print(f'memory: {benchmark_memory(size)} bytes/instance')
+
+
+def run_hbase_path(size=100000, users=1000, page_size=20):
+    ts = int(time.time() * 1000000)
+    bulk_data = [
+        {'from_user_id': i % users, 'to_user_id': i, 'created_at': ts + i}
+        for i in range(size)
+    ]
+    with override_settings(HBASE_BACKEND='memory'):
+        HBaseClient.clear()
+
+        start = time.perf_counter()
+        for data in helpers.chunks(bulk_data, 1000):
+            HBaseFromUser.bulk_create(data)
+        print(f'bulk_create: {int(size / (time.perf_counter() - start))} rows/sec')
+
+        start = time.perf_counter()
+        for user_id in range(users):
+            HBaseFromUser.filter(prefix=(user_id, ), limit=page_size, reverse=True)
+        print(f'filter page: {int(users / (time.perf_counter() - start))} pages/sec')
+
+        start = time.perf_counter()
+        for data in helpers.chunks(bulk_data, page_size):
+            HBaseFromUser.get_many(data)
+        print(f'get_many: {int(size / (time.perf_counter() - start))} rows/sec')
+
+        start = time.perf_counter()
+        count = sum(1 for _ in HBaseFromUser.iter_filter())
+        print(f'iter_filter: {int(count / (time.perf_counter() - start))} rows/sec')
+
+        HBaseClient.clear()
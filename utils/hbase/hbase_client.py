@@ -1,19 +1,86 @@
+from contextlib import contextmanager
 from django.conf import settings
+from thriftpy2.thrift import TException
+from utils.hbase.memory_client import MemoryConnection, MemoryHBase
 import happybase
+import os
+import socket
+import threading
+import time
 
 
 class HBaseClient:
-    conn = None
+    pool = None
+    pool_pid = None
+    local = threading.local()
+
+    @classmethod
+    def get_pool(cls):
+        # celery prefork workers must not share sockets opened by the parent process,
+        # so the pool is rebuilt once per process
+        if cls.pool is None or cls.pool_pid != os.getpid():
+            cls.pool = happybase.ConnectionPool(
+                size=settings.HBASE_POOL_SIZE,
+                host=settings.HBASE_HOST,
+            )
+            cls.pool_pid = os.getpid()
+        return cls.pool
 
     @classmethod
     def get_connection(cls):
-        if not cls.conn:
-            cls.conn = happybase.Connection(settings.HBASE_HOST)
-        return cls.conn
+        # connection owned by current thread, for callers not checking out from the pool
+        if settings.HBASE_BACKEND == 'memory':
+            return MemoryConnection()
+        if getattr(cls.local, 'pid', None) != os.getpid():
+            cls.local.conn = happybase.Connection(settings.HBASE_HOST)
+            cls.local.pid = os.getpid()
+        return cls.local.conn
+
+    @classmethod
+    @contextmanager
+    def connection(cls):
+        """
+        check out a connection from the pool, it will be returned to pool on exit.
+        nested calls in the same thread reuse the same connection.
+        """
+        if settings.HBASE_BACKEND == 'memory':
+            yield MemoryConnection()
+            return
+
+        pool = cls.get_pool()
+        with pool.connection(timeout=settings.HBASE_POOL_TIMEOUT) as conn:
+            cls._check_health(conn)
+            try:
+                yield conn
+            finally:
+                # connection broken in the block is replaced by the pool,
+                # others are checked again once idle
+                conn.last_used_at = time.time()
+
+    @classmethod
+    def _check_health(cls, conn):
+        # thrift server may drop idle sockets, ping before reusing an idle connection
+        last_used_at = getattr(conn, 'last_used_at', None)
+        if last_used_at is None:
+            return
+        if time.time() - last_used_at < settings.HBASE_POOL_HEALTH_CHECK_INTERVAL:
+            return
+        try:
+            conn.tables()
+        except (TException, socket.error):
+            # reconnect the transport
+            conn.close()
+            conn.open()
 
     @classmethod
     def clear(cls):
         from utils.hbase.models import HBaseModel
+        if settings.HBASE_BACKEND == 'memory':
+            MemoryHBase.clear()
+            for hbase_model in HBaseModel.__subclasses__():
+                hbase_model.create_table()
+            return
+
         for hbase_model in HBaseModel.__subclasses__():
             hbase_model.delete_table()
             hbase_model.create_table()
@@ -0,0 +1,284 @@
+"""
+in memory stand-in of the happybase api used by HBaseModel, for tests and benchmarks.
+enabled by HBASE_BACKEND = 'memory' in settings. data lives in the current process only.
+supported filters: SingleColumnValueFilter, KeyOnlyFilter, FirstKeyOnlyFilter, PageFilter, AND
+"""
+from bisect import bisect_left, bisect_right, insort
+import operator
+import re
+import threading
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return bytes(str(value), encoding='utf-8')
+
+
+class MemoryHBase:
+    # table name => MemoryTableData
+    tables = {}
+    lock = threading.RLock()
+
+    @classmethod
+    def clear(cls):
+        # reset data but keep tables, no DDL needed
+        with cls.lock:
+            for table_data in cls.tables.values():
+                table_data.clear()
+
+
+class MemoryTableData:
+    def __init__(self, families):
+        self.families = set(families)
+        # row key => {column key => value}, sorted_keys keeps row keys in order
+        self.rows = {}
+        self.sorted_keys = []
+
+    def clear(self):
+        self.rows = {}
+        self.sorted_keys = []
+
+
+class MemoryConnection:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def table(self, name):
+        return MemoryTable(_to_bytes(name).decode('utf-8'))
+
+    def tables(self):
+        return [_to_bytes(name) for name in MemoryHBase.tables]
+
+    def create_table(self, name, families):
+        with MemoryHBase.lock:
+            if name in MemoryHBase.tables:
+                raise ValueError(f'table {name} exists')
+            MemoryHBase.tables[name] = MemoryTableData(_to_bytes(family) for family in families)
+
+    def delete_table(self, name, disable=False):
+        with MemoryHBase.lock:
+            MemoryHBase.tables.pop(name, None)
+
+
+class MemoryTable:
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def data(self):
+        if self.name not in MemoryHBase.tables:
+            raise ValueError(f'table {self.name} not found')
+        return MemoryHBase.tables[self.name]
+
+    def put(self, row, data):
+        data = {_to_bytes(key): _to_bytes(value) for key, value in data.items()}
+        with MemoryHBase.lock:
+            table_data = self.data
+            if row not in table_data.rows:
+                insort(table_data.sorted_keys, row)
+                table_data.rows[row] = {}
+            table_data.rows[row].update(data)
+
+    def delete(self, row, columns=None):
+        with MemoryHBase.lock:
+            table_data = self.data
+            if row not in table_data.rows:
+                return
+            if columns is not None:
+                for column in columns:
+                    table_data.rows[row].pop(_to_bytes(column), None)
+                if table_data.rows[row]:
+                    return
+            del table_data.rows[row]
+            table_data.sorted_keys.pop(bisect_left(table_data.sorted_keys, row))
+
+    def row(self, row, columns=None):
+        with MemoryHBase.lock:
+            row_data = self.data.rows.get(row, {})
+            return _project(row_data, columns)
+
+    def rows(self, rows, columns=None):
+        result = []
+        for row in rows:
+            row_data = self.row(row, columns=columns)
+            if row_data:
+                result.append((row, row_data))
+        return result
+
+    def scan(self, row_start=None, row_stop=None, row_prefix=None, columns=None, filter=None,
+             limit=None, reverse=False, batch_size=1000, **kwargs):
+        if row_prefix is not None and (row_start is not None or row_stop is not None):
+            raise TypeError("'row_prefix' cannot be combined with 'row_start' or 'row_stop'")
+        row_filter = MemoryFilter.parse(filter) if filter else None
+
+        # rows are collected under lock, so writes while scanning do not break the scan
+        with MemoryHBase.lock:
+            keys = self.data.sorted_keys
+            if row_prefix is not None:
+                lo = hi = bisect_left(keys, row_prefix)
+                while hi < len(keys) and keys[hi].startswith(row_prefix):
+                    hi += 1
+            elif not reverse:
+                lo = bisect_left(keys, row_start) if row_start is not None else 0
+                hi = bisect_left(keys, row_stop) if row_stop is not None else len(keys)
+            else:
+                # reverse scan goes from row_start (included) down to row_stop (excluded)
+                lo = bisect_right(keys, row_stop) if row_stop is not None else 0
+                hi = bisect_right(keys, row_start) if row_start is not None else len(keys)
+            indexes = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+            rows = self.data.rows
+
+            result = []
+            for idx in indexes:
+                if limit is not None and len(result) >= limit:
+                    break
+                key = keys[idx]
+                row_data = rows[key]
+                if row_filter is not None:
+                    row_data = row_filter.apply(row_data)
+                    if row_data is None:
+                        continue
+                row_data = _project(row_data, columns)
+                if not row_data:
+                    continue
+                result.append((key, row_data))
+        yield from result
+
+    def batch(self):
+        return MemoryBatch(self)
+
+
+class MemoryBatch:
+    def __init__(self, table):
+        self.table = table
+        self.mutations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+    def put(self, row, data):
+        self.mutations.append((self.table.put, row, data))
+
+    def delete(self, row, columns=None):
+        self.mutations.append((self.table.delete, row, columns))
+
+    def send(self):
+        with MemoryHBase.lock:
+            for mutate, row, argument in self.mutations:
+                mutate(row, argument)
+        self.mutations = []
+
+
+def _project(row_data, columns):
+    # columns can be b'cf:qualifier' or a whole column family b'cf'
+    if columns is None:
+        return dict(row_data)
+    columns = [_to_bytes(column) for column in columns]
+    return {
+        key: value
+        for key, value in row_data.items()
+        if key in columns or key.split(b':', 1)[0] in columns
+    }
+
+
+class MemoryFilter:
+    TOKEN_PATTERN = re.compile(rb"\s*('(?:[^']|'')*'|[A-Za-z]+|<=|>=|!=|=|<|>|\d+|[(),])")
+    COMPARE_OPERATORS = {
+        b'<': operator.lt,
+        b'<=': operator.le,
+        b'=': operator.eq,
+        b'!=': operator.ne,
+        b'>': operator.gt,
+        b'>=': operator.ge,
+    }
+
+    def __init__(self, filters):
+        # [(filter name, [arguments])]
+        self.filters = filters
+        self.page_count = 0
+
+    @classmethod
+    def parse(cls, filter_string):
+        tokens = cls.tokenize(_to_bytes(filter_string))
+        filters = []
+        idx = 0
+        while idx < len(tokens):
+            if filters:
+                if tokens[idx] != (b'AND', False):
+                    raise NotImplementedError(f'{tokens[idx][0]} is not supported in memory hbase')
+                idx += 1
+            name, _ = tokens[idx]
+            if tokens[idx + 1] != (b'(', False):
+                raise ValueError(f'bad filter string {filter_string}')
+            idx += 2
+            arguments = []
+            while tokens[idx] != (b')', False):
+                if tokens[idx] != (b',', False):
+                    arguments.append(tokens[idx][0])
+                idx += 1
+            filters.append((name, arguments))
+            idx += 1
+        return cls(filters)
+
+    @classmethod
+    def tokenize(cls, filter_string):
+        """
+        => [(token, is_quoted)], quoted value may contain any byte like ')' or ','
+        """
+        tokens = []
+        position = 0
+        filter_string = filter_string.strip()
+        while position < len(filter_string):
+            match = cls.TOKEN_PATTERN.match(filter_string, position)
+            if not match:
+                raise ValueError(f'bad filter string {filter_string}')
+            token = match.group(1)
+            if token.startswith(b"'"):
+                tokens.append((token[1:-1].replace(b"''", b"'"), True))
+            else:
+                tokens.append((token, False))
+            position = match.end()
+        return tokens
+
+    def apply(self, row_data):
+        """
+        return filtered row data, None if row is filtered out
+        """
+        page_size = None
+        for name, arguments in self.filters:
+            if name == b'SingleColumnValueFilter':
+                if not self._match_column_value(row_data, *arguments):
+                    return None
+            elif name == b'KeyOnlyFilter':
+                row_data = {key: b'' for key in row_data}
+            elif name == b'FirstKeyOnlyFilter':
+                first_key = min(row_data)
+                row_data = {first_key: row_data[first_key]}
+            elif name == b'PageFilter':
+                page_size = int(arguments[0])
+            else:
+                raise NotImplementedError(f'{name} is not supported in memory hbase')
+        if page_size is not None:
+            if self.page_count >= page_size:
+                return None
+            self.page_count += 1
+        return row_data
+
+    def _match_column_value(self, row_data, family, qualifier, op, comparator, filter_if_missing=b'true', *args):
+        if not comparator.startswith(b'binary:'):
+            raise NotImplementedError(f'{comparator} is not supported in memory hbase')
+        value = row_data.get(family + b':' + qualifier)
+        if value is None:
+            return filter_if_missing.lower() != b'true'
+        return self.COMPARE_OPERATORS[op](value, comparator[len(b'binary:'):])
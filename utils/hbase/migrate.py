@@ -0,0 +1,25 @@
+"""
+copy rows of one hbase model table into another one, e.g. switch a model to binary codec:
+1. declare a new model with the same fields, a new table_name and codec = 'binary' in Meta
+2. python manage.py shell -c "from utils.hbase.migrate import migrate_table; \
+   from newsfeeds.hbase_models import HBaseNewsFeed, HBaseNewsFeedV2; \
+   migrate_table(HBaseNewsFeed, HBaseNewsFeedV2)"
+3. switch reads and writes to the new model, then drop the old table
+"""
+from django.conf import settings
+from utils import helpers
+
+
+def migrate_table(source_model, target_model, batch_size=None):
+    if source_model.get_field_hash().keys() != target_model.get_field_hash().keys():
+        raise ValueError(f'{source_model.__name__} and {target_model.__name__} have different fields')
+
+    batch_size = batch_size or settings.HBASE_SCAN_BATCH_SIZE
+    target_model.create_table()
+    # rows are decoded by source codec and encoded again by target codec
+    rows = source_model.iter_filter(batch_size=batch_size)
+    count = 0
+    for instances in helpers.chunks(rows, batch_size):
+        target_model.bulk_create([instance.to_dict() for instance in instances])
+        count += len(instances)
+    return count
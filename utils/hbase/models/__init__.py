@@ -1,3 +1,5 @@
 from .exceptions import *
 from .fields import *
+from .codecs import *
 from .models import *
+from .batch import *
@@ -0,0 +1,50 @@
+from utils.hbase.hbase_client import HBaseClient
+from utils.hbase.models.exceptions import EmptyColumnError
+
+
+# unit of work across hbase models, puts and deletes are grouped by table and
+# sent when the with block exits without error, one round trip per table.
+# tables are sent in the order they are first used in the batch.
+# example
+# with HBaseBatch() as batch:
+#     batch.create(HBaseToUser, from_user_id=1, to_user_id=2, created_at=ts)
+#     batch.delete(HBaseFromUser, from_user_id=1, created_at=ts)
+class HBaseBatch:
+    def __init__(self):
+        # model class => [(row_key, row_data)], row_data None means delete
+        self.mutations = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+    def put(self, instance):
+        row_data = instance.row_data
+        if len(row_data) == 0:
+            raise EmptyColumnError()
+        self.mutations.setdefault(instance.__class__, []).append((instance.row_key, row_data))
+        return instance
+
+    def create(self, model_class, **kwargs):
+        return self.put(model_class(**kwargs))
+
+    def delete(self, model_class, **kwargs):
+        row_key = model_class.serialize_row_key(kwargs)
+        self.mutations.setdefault(model_class, []).append((row_key, None))
+
+    def send(self):
+        if not self.mutations:
+            return
+        with HBaseClient.connection() as conn:
+            for model_class, mutations in self.mutations.items():
+                batch = conn.table(model_class.get_table_name()).batch()
+                for row_key, row_data in mutations:
+                    if row_data is None:
+                        batch.delete(row_key)
+                    else:
+                        batch.put(row_key, row_data)
+                batch.send()
+        self.mutations = {}
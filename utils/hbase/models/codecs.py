@@ -0,0 +1,96 @@
+from utils.hbase.models.exceptions import BadRowKeyError
+import struct
+import zlib
+
+
+class StringCodec:
+    """
+    default codec, values are zero padded 16 digits, reverse field is reversed string
+    {key1: 1, key2: 2} => b"1000000000000000:0000000000000002"
+    """
+    name = 'string'
+
+    @classmethod
+    def serialize_value(cls, field, value):
+        return field.serialize(value)
+
+    @classmethod
+    def deserialize_value(cls, field, value):
+        return field.deserialize(value)
+
+    @classmethod
+    def serialize_row_key(cls, row_key_fields, values):
+        serialized_values = []
+        for (key, field), value in zip(row_key_fields, values):
+            value = cls.serialize_value(field, value)
+            if ':' in value:
+                raise BadRowKeyError(f'{key} should not contain ":" in value {value}')
+            serialized_values.append(value)
+        return bytes(':'.join(serialized_values), encoding='utf-8')
+
+    @classmethod
+    def deserialize_row_key(cls, row_key_fields, row_key):
+        if isinstance(row_key, bytes):
+            row_key = row_key.decode('utf-8')
+        values = row_key.split(':')
+        return {
+            key: cls.deserialize_value(field, value)
+            for (key, field), value in zip(row_key_fields, values)
+        }
+
+
+class BinaryCodec:
+    """
+    values are 8 bytes big-endian unsigned integers, fixed width so no separator needed.
+    reverse field gets 1 byte hash salt in front instead of reversed string,
+    it spreads sequential ids over regions and keeps prefix scan working.
+    {key1: 1, key2: 2} => b"<salt(1)>\x00...\x01\x00...\x02" (17 bytes vs 33 bytes by string codec)
+    """
+    name = 'binary'
+    packer = struct.Struct('>Q')
+    salt_size = 1
+
+    @classmethod
+    def salt(cls, packed_value):
+        return bytes([zlib.crc32(packed_value) & 0xFF])
+
+    @classmethod
+    def serialize_value(cls, field, value):
+        try:
+            return cls.packer.pack(int(value))
+        except struct.error:
+            raise BadRowKeyError(f'{value} is out of range of unsigned 64 bits integer')
+
+    @classmethod
+    def deserialize_value(cls, field, value):
+        return cls.packer.unpack(value)[0]
+
+    @classmethod
+    def serialize_row_key(cls, row_key_fields, values):
+        serialized_values = []
+        for (key, field), value in zip(row_key_fields, values):
+            value = cls.serialize_value(field, value)
+            if field.reverse:
+                serialized_values.append(cls.salt(value))
+            serialized_values.append(value)
+        return b''.join(serialized_values)
+
+    @classmethod
+    def deserialize_row_key(cls, row_key_fields, row_key):
+        data = {}
+        offset = 0
+        for key, field in row_key_fields:
+            if offset >= len(row_key):
+                break
+            if field.reverse:
+                offset += cls.salt_size
+            value = row_key[offset:offset + cls.packer.size]
+            data[key] = cls.deserialize_value(field, value)
+            offset += cls.packer.size
+        return data
+
+
+CODECS = {
+    StringCodec.name: StringCodec,
+    BinaryCodec.name: BinaryCodec,
+}
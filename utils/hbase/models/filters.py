@@ -0,0 +1,53 @@
+# build hbase filter language strings, they are evaluated by region server
+# https://hbase.apache.org/book.html#thrift.filter_language
+# example
+# and_filters(
+#     single_column_value_filter('cf', 'to_user_id', '0000000000000002'),
+#     key_only_filter(),
+# ) => b"SingleColumnValueFilter('cf', 'to_user_id', =, 'binary:0000000000000002', true, true)
+#        AND KeyOnlyFilter()"
+
+COMPARE_OPERATORS = ('<', '<=', '=', '!=', '>', '>=')
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return bytes(str(value), encoding='utf-8')
+
+
+def _quote(value):
+    # single quote is escaped by doubling it
+    return b"'" + _to_bytes(value).replace(b"'", b"''") + b"'"
+
+
+def single_column_value_filter(column_family, qualifier, value, op='=', filter_if_missing=True):
+    if op not in COMPARE_OPERATORS:
+        raise ValueError(f'unknown compare operator {op}')
+    return b''.join([
+        b'SingleColumnValueFilter(',
+        _quote(column_family), b', ',
+        _quote(qualifier), b', ',
+        _to_bytes(op), b', ',
+        _quote(b'binary:' + _to_bytes(value)), b', ',
+        b'true' if filter_if_missing else b'false',
+        b', true)',
+    ])
+
+
+def key_only_filter():
+    # only row keys and column keys are returned, values are empty
+    return b'KeyOnlyFilter()'
+
+
+def first_key_only_filter():
+    return b'FirstKeyOnlyFilter()'
+
+
+def page_filter(page_size):
+    # limit is applied by each region server, use scan limit for an exact count
+    return b'PageFilter(' + _to_bytes(int(page_size)) + b')'
+
+
+def and_filters(*filters):
+    return b' AND '.join(_to_bytes(f) for f in filters if f)
@@ -1,33 +1,85 @@
+from contextlib import contextmanager
 from django.conf import settings
 from utils.hbase.hbase_client import HBaseClient
 from utils.hbase.models import HBaseField
+from utils.hbase.models import filters
+from utils.hbase.models.codecs import CODECS
 from utils.hbase.models.exceptions import EmptyColumnError, BadRowKeyError
 
 
+class HBaseModelMeta(type):
+    """
+    collect field metadata once when model class is created,
+    so that (de)serializing rows does not walk cls.__dict__ for every row.
+    fields are moved out of class attributes and become __slots__,
+    instances have no __dict__ which saves memory for large scans.
+    """
+    def __new__(mcs, name, bases, attrs):
+        field_hash = {
+            key: obj
+            for key, obj in attrs.items()
+            if isinstance(obj, HBaseField)
+        }
+        attrs = {
+            key: obj
+            for key, obj in attrs.items()
+            if key not in field_hash
+        }
+        attrs['__slots__'] = tuple(field_hash)
+        cls = super().__new__(mcs, name, bases, attrs)
+        cls._field_hash = field_hash
+        # column_family means column key, otherwise it is part of row key
+        cls._row_key_fields = tuple(
+            (key, field)
+            for key, field in cls._field_hash.items()
+            if not field.column_family
+        )
+        cls._column_fields = tuple(
+            (key, field, bytes(f'{field.column_family}:{key}', encoding='utf-8'))
+            for key, field in cls._field_hash.items()
+            if field.column_family
+        )
+        # b'cf:key' => (key, field)
+        cls._decode_table = {
+            column_key: (key, field)
+            for key, field, column_key in cls._column_fields
+        }
+        cls._codec = CODECS[getattr(cls.Meta, 'codec', 'string')]
+        return cls
+
+
 # example
 # 1. HBaseModel.create(from_user_id=1, to_user_id=2, created_at=ts)
 # 2. instance = HBaseModel(from_user_id=1, to_user_id=2, created_at=ts)
 #    instance.save()
 # 3. instance.from_user_id = 1
 #    instance.save()
-class HBaseModel:
+class HBaseModel(metaclass=HBaseModelMeta):
     def __init__(self, **kwargs):
-        for field, _ in self.get_field_hash().items():
-            setattr(self, field, kwargs.get(field))
+        for key in self._field_hash:
+            setattr(self, key, kwargs.get(key))
 
     def save(self):
         if len(self.row_data) == 0:
             raise EmptyColumnError()
-        table = self.get_table()
-        table.put(self.row_key, self.row_data)
+        with self.table() as table:
+            table.put(self.row_key, self.row_data)
 
     class Meta:
         table_name = None
         row_key = ()
+        # 'string' or 'binary', see codecs.py
+        codec = 'string'
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self._field_hash}
 
     @property
     def row_key(self):
-        return self.serialize_row_key(self.__dict__)
+        return self.serialize_row_key({
+            key: getattr(self, key)
+            for key, _ in self._row_key_fields
+        })
 
     # alias for row_key used by model
     @property
@@ -36,7 +88,10 @@ class HBaseModel:
 
     @property
     def row_data(self):
-        return self.serialize_row_data(self.__dict__)
+        return self.serialize_row_data({
+            key: getattr(self, key)
+            for key, _, _ in self._column_fields
+        })
 
     @classmethod
     def create(cls, **kwargs):
@@ -46,83 +101,92 @@ class HBaseModel:
 
     @classmethod
     def bulk_create(cls, bulk_data):
-        table = cls.get_table()
-        batch = table.batch()
         instances = []
-        for data in bulk_data:
-            instance = cls(**data)
-            instances.append(instance)
-            batch.put(instance.row_key, instance.row_data)
-        batch.send()
+        with cls.table() as table:
+            batch = table.batch()
+            for data in bulk_data:
+                instance = cls(**data)
+                instances.append(instance)
+                batch.put(instance.row_key, instance.row_data)
+            batch.send()
         return instances
 
     @classmethod
     def delete(cls, **kwargs):
         row_key = cls.serialize_row_key(kwargs)
-        table = cls.get_table()
-        return table.delete(row_key)
+        with cls.table() as table:
+            return table.delete(row_key)
 
     @classmethod
     def get(cls, **kwargs):
         row_key = cls.serialize_row_key(kwargs)
-        table = cls.get_table()
-        row_data = table.row(row_key)
+        with cls.table() as table:
+            row_data = table.row(row_key)
         return cls.deserialize_row_data(row_key, row_data)
 
+    @classmethod
+    def get_many(cls, row_key_list):
+        """
+        get rows in one round trip, keep the order of input, None for missing rows
+        [{key1: val1, key2: val2}, {key1: val3, key2: val4}] => [instance1, None]
+        """
+        row_keys = [cls.serialize_row_key(data) for data in row_key_list]
+        if not row_keys:
+            return []
+        with cls.table() as table:
+            rows = dict(table.rows(row_keys))
+        return [
+            cls.deserialize_row_data(row_key, rows.get(row_key))
+            for row_key in row_keys
+        ]
+
+    @classmethod
+    @contextmanager
+    def table(cls):
+        """
+        table is bound to a pooled connection, only use it inside the with block
+        with cls.table() as table:
+            table.put(row_key, row_data)
+        """
+        with HBaseClient.connection() as conn:
+            yield conn.table(cls.get_table_name())
+
     @classmethod
     def get_table(cls):
-        conn = HBaseClient.get_connection()
-        return conn.table(cls.get_table_name())
+        # table bound to the connection of current thread, outside of the pool
+        return HBaseClient.get_connection().table(cls.get_table_name())
 
     @classmethod
     def get_field_hash(cls):
-        field_hash = {}
-        for key, obj in cls.__dict__.items():
-            if isinstance(obj, HBaseField):
-                field_hash[key] = obj
-        return field_hash
+        return cls._field_hash
 
     @classmethod
     def serialize_row_key(cls, data, is_prefix=False):
         """
-        serialize dict to bytes (not str)
+        serialize dict to bytes (not str), examples by string codec
         {key1: val1} => b"val1"
         {key1: val1, key2: val2} => b"val1:val2"
         {key1: val1, key2: val2, key3: val3} => b"val1:val2:val3"
         """
-        fields = cls.get_field_hash()
         values = []
-        for key, field in fields.items():
-            if field.column_family: # column_family means column key
-                continue
+        for key, _ in cls._row_key_fields:
             value = data.get(key)
             if value is None:
                 if not is_prefix:
                     raise BadRowKeyError(f'{key} is missing in row key')
                 break
-            value = field.serialize(value)
-            if ':' in value:
-                raise BadRowKeyError(f'{key} should not contain ":" in value {value}')
             values.append(value)
-        return bytes(':'.join(values), encoding='utf-8')
+        return cls._codec.serialize_row_key(cls._row_key_fields, values)
 
     @classmethod
     def deserialize_row_key(cls, row_key):
         """
+        examples by string codec
         "val1" => {'key1': val1, 'key2': None, 'key3': None}
         "val1:val2" => {'key1': val1, 'key2': val2, 'key3': None}
         "val1:val2:val3" => {'key1': val1, 'key2': val2, 'key3': val3}
         """
-        if isinstance(row_key, bytes):
-            row_key = row_key.decode('utf-8')
-        values = row_key.split(':')
-        data = {}
-        fields = cls.get_field_hash()
-        for i in range(len(values)):
-            key = cls.Meta.row_key[i]
-            value = fields[key].deserialize(values[i])
-            data[key] = value
-        return data
+        return cls._codec.deserialize_row_key(cls._row_key_fields, row_key)
 
     @classmethod
     def serialize_row_key_from_tuple(cls, row_key_tuple):
@@ -137,15 +201,11 @@ class HBaseModel:
     @classmethod
     def serialize_row_data(cls, data):
         row_data = {}
-        field_hash = cls.get_field_hash()
-        for key, field in field_hash.items():
-            if not field.column_family:
-                continue
-            column_key = f'{field.column_family}:{key}'
+        for key, field, column_key in cls._column_fields:
             column_value = data.get(key)
             if column_value is None:
                 continue
-            row_data[column_key] = field.serialize(column_value)
+            row_data[column_key] = cls._codec.serialize_value(field, column_value)
         return row_data
 
     @classmethod
@@ -153,12 +213,13 @@ class HBaseModel:
         if not row_data:
             return None
         data = cls.deserialize_row_key(row_key)
-        fields = cls.get_field_hash()
+        decode_table = cls._decode_table
         for column_key, column_value in row_data.items():
-            column_key = column_key.decode('utf-8')
-            # remove column family
-            key = column_key[column_key.index(':') + 1:]
-            data[key] = fields[key].deserialize(column_value)
+            # value is empty when scan with key only filter
+            if not column_value:
+                continue
+            key, field = decode_table[column_key]
+            data[key] = cls._codec.deserialize_value(field, column_value)
         return cls(**data)
 
     @classmethod
@@ -171,44 +232,101 @@ class HBaseModel:
 
     @classmethod
     def create_table(cls):
-        conn = HBaseClient.get_connection()
-        tables = [table.decode('utf_8') for table in conn.tables()]
-        # check if table exists already
-        if cls.get_table_name() in tables:
-            return
-        column_families = {
-            field.column_family : dict()
-            for key, field in cls.get_field_hash().items()
-            if field.column_family is not None
-        }
-        conn.create_table(cls.get_table_name(), column_families)
+        with HBaseClient.connection() as conn:
+            tables = [table.decode('utf_8') for table in conn.tables()]
+            # check if table exists already
+            if cls.get_table_name() in tables:
+                return
+            column_families = {
+                field.column_family : dict()
+                for key, field, _ in cls._column_fields
+            }
+            conn.create_table(cls.get_table_name(), column_families)
 
     @classmethod
     def delete_table(cls):
-        conn = HBaseClient.get_connection()
-        tables = [table.decode('utf_8') for table in conn.tables()]
-        if not cls.get_table_name() in tables:
-            return
-        conn.delete_table(cls.get_table_name(), True)
+        with HBaseClient.connection() as conn:
+            tables = [table.decode('utf_8') for table in conn.tables()]
+            if not cls.get_table_name() in tables:
+                return
+            conn.delete_table(cls.get_table_name(), True)
 
     @classmethod
-    def filter(cls, start=None, stop=None, prefix=None, limit=None, reverse=False):
-        row_start = cls.serialize_row_key_from_tuple(start)
-        row_stop = cls.serialize_row_key_from_tuple(stop)
-        row_prefix = cls.serialize_row_key_from_tuple(prefix)
+    def get_column_keys(cls, keys):
+        """
+        ('to_user_id', ) => [b'cf:to_user_id']
+        """
+        column_keys = {key: column_key for key, _, column_key in cls._column_fields}
+        for key in keys:
+            if key not in column_keys:
+                raise ValueError(f'{key} is not a column of {cls.__name__}')
+        return [column_keys[key] for key in keys]
 
-        # scan table with conditions
-        rows = cls.get_table().scan(
-            row_start=row_start,
-            row_stop=row_stop,
-            row_prefix=row_prefix,
-            limit=limit,
-            reverse=reverse
+    @classmethod
+    def column_value_filter(cls, key, value, op='='):
+        """
+        filter rows by column value on region server
+        HBaseFromUser.column_value_filter('to_user_id', 2)
+        """
+        key, field = cls._decode_table[cls.get_column_keys([key])[0]]
+        return filters.single_column_value_filter(
+            field.column_family,
+            key,
+            cls._codec.serialize_value(field, value),
+            op=op,
         )
 
-        # deserialize
-        return [
-            cls.deserialize_row_data(row_key, row_data)
-            for row_key, row_data in rows
-        ]
+    @classmethod
+    def filter(cls, start=None, stop=None, prefix=None, limit=None, reverse=False, columns=None, filter=None):
+        return list(cls.iter_filter(
+            start=start,
+            stop=stop,
+            prefix=prefix,
+            limit=limit,
+            reverse=reverse,
+            columns=columns,
+            filter=filter,
+        ))
+
+    @classmethod
+    def iter_filter(
+        cls,
+        start=None,
+        stop=None,
+        prefix=None,
+        limit=None,
+        reverse=False,
+        columns=None,
+        filter=None,
+        batch_size=None,
+    ):
+        """
+        lazy version of filter, scanner fetches batch_size rows per round trip and
+        rows are deserialized one by one, so memory keeps constant for huge scans.
+        columns: column field names to fetch, others are left None
+        filter: filter string built by utils.hbase.models.filters, e.g.
+            HBaseFromUser.column_value_filter('to_user_id', 2)
+        """
+        row_start = cls.serialize_row_key_from_tuple(start)
+        row_stop = cls.serialize_row_key_from_tuple(stop)
+        row_prefix = cls.serialize_row_key_from_tuple(prefix)
+        column_keys = cls.get_column_keys(columns) if columns is not None else None
 
+        with cls.table() as table:
+            # scan table with conditions
+            rows = table.scan(
+                row_start=row_start,
+                row_stop=row_stop,
+                row_prefix=row_prefix,
+                columns=column_keys,
+                filter=filter,
+                limit=limit,
+                reverse=reverse,
+                batch_size=batch_size or settings.HBASE_SCAN_BATCH_SIZE,
+            )
+            try:
+                for row_key, row_data in rows:
+                    yield cls.deserialize_row_data(row_key, row_data)
+            finally:
+                # close scanner before the connection goes back to pool
+                rows.close()
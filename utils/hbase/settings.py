@@ -1,6 +1,18 @@
+import os
+import sys
+
 print(__name__ + ' loaded.')
 
 # start hbase: sudo bin/start-hbase.sh
 # visit hbase: http://192.168.33.10:16010
 # start thrift: sudo bin/hbase-daemon.sh start thrift
 HBASE_HOST = 'hbase'
+# 'thrift' or 'memory', memory is an in process stand-in used by tests, see memory_client.py.
+# tests run against thrift with HBASE_BACKEND=thrift in environment
+HBASE_BACKEND = 'thrift' if ((" ".join(sys.argv)).find('manage.py test') == -1) else os.environ.get('HBASE_BACKEND', 'memory')
+
+# connection pool, size is per process (django worker or celery worker)
+HBASE_POOL_SIZE = 10
+HBASE_POOL_TIMEOUT = 3  # in seconds, wait for a free connection
+HBASE_POOL_HEALTH_CHECK_INTERVAL = 60  # in seconds, ping connection idle longer than this
+HBASE_SCAN_BATCH_SIZE = 1000  # rows fetched per scanner round trip
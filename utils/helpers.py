@@ -1,12 +1,30 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import islice
 from rest_framework import status
 from rest_framework.response import Response
 import pytz
 
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
 
 def utc_now():
     return datetime.now().replace(tzinfo=pytz.utc)
 
+def datetime_to_timestamp(value):
+    # microsecond timestamp without float rounding
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def timestamp_to_datetime(value):
+    return EPOCH + timedelta(microseconds=value)
+
+def chunks(iterable, size):
+    # split any iterable into lists of size, without loading it all into memory
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
 def validation_errors_response(errors):
     return Response({
         'success': False,
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from django.conf import settings
+from utils.redis.redis_client import RedisClient
+import os
+import redis
+import threading
+import time
+
+
+# process local LRU in front of memcached, bounded by LOCAL_CACHE_SIZE and LOCAL_CACHE_TTL.
+# invalidation of a key is published to LOCAL_CACHE_CHANNEL, a subscriber thread in
+# every process drops the key from its own cache.
+class LocalCache:
+    # key => (expire at, object)
+    data = OrderedDict()
+    lock = threading.Lock()
+    pid = None
+
+    @classmethod
+    def _ensure_subscriber(cls):
+        # forked workers do not inherit the subscriber thread, start one per process
+        if cls.pid == os.getpid():
+            return
+        with cls.lock:
+            if cls.pid == os.getpid():
+                return
+            cls.data = OrderedDict()
+            cls.pid = os.getpid()
+        thread = threading.Thread(target=cls._listen, name='local-cache-subscriber', daemon=True)
+        thread.start()
+
+    @classmethod
+    def _listen(cls):
+        while True:
+            try:
+                pubsub = RedisClient.get_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(settings.LOCAL_CACHE_CHANNEL)
+                for message in pubsub.listen():
+                    cls.delete(message['data'].decode('utf-8'))
+            except redis.RedisError:
+                # invalidations may be lost while reconnecting
+                cls.clear()
+                time.sleep(1)
+
+    @classmethod
+    def get(cls, key):
+        """
+        => (hit, object)
+        """
+        cls._ensure_subscriber()
+        with cls.lock:
+            item = cls.data.get(key)
+            if item is None:
+                return False, None
+            expire_at, obj = item
+            if expire_at < time.monotonic():
+                del cls.data[key]
+                return False, None
+            cls.data.move_to_end(key)
+            return True, obj
+
+    @classmethod
+    def set_many(cls, objects):
+        cls._ensure_subscriber()
+        expire_at = time.monotonic() + settings.LOCAL_CACHE_TTL
+        with cls.lock:
+            for key, obj in objects.items():
+                cls.data[key] = (expire_at, obj)
+                cls.data.move_to_end(key)
+            while len(cls.data) > settings.LOCAL_CACHE_SIZE:
+                cls.data.popitem(last=False)
+
+    @classmethod
+    def delete(cls, key):
+        with cls.lock:
+            cls.data.pop(key, None)
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.data.clear()
+
+    @classmethod
+    def invalidate(cls, key):
+        # drop the key in this process at once, other processes drop it when message arrives
+        cls.delete(key)
+        RedisClient.get_connection().publish(settings.LOCAL_CACHE_CHANNEL, key)
@@ -1,38 +1,202 @@
 from django.conf import settings
 from django.core.cache import caches
+from utils.memcached.local_cache import LocalCache
+from utils.memcached.request_cache import RequestCache
+import time
+import uuid
 
 
 TO_USERS_PATTERN = 'to_users:{from_user_id}'
+# cached as to_users of who follows more than MEMCACHED_TO_USERS_LIMIT users in hbase mode
+TO_USERS_OVERFLOW = '*'
 USER_PROFILE_PATTERN = 'userprofile:{user_id}'
+LOCK_PATTERN = 'lock:{key}'
+
+# key in serializer context, {model class: {object id: object}}
+PREFETCHED_OBJECTS = 'prefetched_objects'
 
 project_memcached = caches['default']
 
 
+class NotFound:
+    # cached for objects not exist, so dangling references cost one cache hit instead of one query
+    pass
+
+
+NOT_FOUND = NotFound()
+
+
 class MemcachedHelper:
     @classmethod
     def _get_key(cls, model_class, object_id):
         return '{}:{}'.format(model_class.__name__, object_id)
 
+    @classmethod
+    def from_cached(cls, cached):
+        # NOT_FOUND in cache means object not exists
+        if isinstance(cached, NotFound):
+            return None
+        return cached
+
+    @classmethod
+    def set_loaded_objects(cls, objects):
+        """
+        objects: {key: object}, None means object not exists,
+        which is cached as NOT_FOUND for a short time
+        """
+        project_memcached.set_many({key: obj for key, obj in objects.items() if obj is not None})
+        not_found = {key: NOT_FOUND for key, obj in objects.items() if obj is None}
+        if not_found:
+            project_memcached.set_many(not_found, timeout=settings.MEMCACHED_NOT_FOUND_TIMEOUT)
+
+    @classmethod
+    def load_with_lock(cls, key, load_object):
+        """
+        single flight of a cache miss, only the worker holding the lock calls load_object
+        and fills the cache, others wait for the cache to be filled.
+        if it is not filled in time, they load the object themselves.
+        """
+        lock_key = LOCK_PATTERN.format(key=key)
+        token = uuid.uuid4().hex
+        if project_memcached.add(lock_key, token, timeout=settings.MEMCACHED_LOCK_TIMEOUT):
+            try:
+                obj = load_object()
+                cls.set_loaded_objects({key: obj})
+                return obj
+            finally:
+                cls._release_lock(lock_key, token)
+
+        for _ in range(settings.MEMCACHED_LOCK_RETRIES):
+            time.sleep(settings.MEMCACHED_LOCK_WAIT)
+            cached = project_memcached.get_many([key, lock_key])
+            if key in cached:
+                return cls.from_cached(cached[key])
+            # lock holder failed to fill the cache
+            if lock_key not in cached:
+                break
+
+        obj = load_object()
+        cls.set_loaded_objects({key: obj})
+        return obj
+
+    @classmethod
+    def _release_lock(cls, lock_key, token):
+        # a lock expired and taken by another worker is not released. django cache has no cas,
+        # a lock taken between get and delete is still released, single flight is best effort anyway
+        if project_memcached.get(lock_key) == token:
+            project_memcached.delete(lock_key)
+
+    @classmethod
+    def _use_local_cache(cls, model_class):
+        return model_class.__name__ in settings.LOCAL_CACHE_MODELS
+
     @classmethod
     def get_object_in_memcached(cls, model_class, object_id):
         key = cls._get_key(model_class, object_id)
 
+        # fetched in this request already
+        hit, obj = RequestCache.get(key)
+        if hit:
+            return obj
+
+        # hot objects are kept in process local cache
+        use_local_cache = cls._use_local_cache(model_class)
+        if use_local_cache:
+            hit, obj = LocalCache.get(key)
+            if hit:
+                RequestCache.set_many({key: obj})
+                return obj
+
         # cache hit
         obj = project_memcached.get(key)
-        if obj:
-            return obj
+        if obj is None:
+            # cache miss
+            obj = cls.load_with_lock(key, lambda: model_class.objects.filter(id=object_id).first())
+        else:
+            obj = cls.from_cached(obj)
+
+        RequestCache.set_many({key: obj})
+        if obj is not None and use_local_cache:
+            LocalCache.set_many({key: obj})
+        return obj
+
+    @classmethod
+    def get_objects_in_memcached(cls, model_class, object_ids):
+        """
+        one get_many for all objects, misses are loaded by one query and set by one set_many
+        return {object_id: obj}, objects not found are not in the dict
+        """
+        keys = {cls._get_key(model_class, object_id): object_id for object_id in object_ids}
+        if not keys:
+            return {}
+
+        # fetched in this request already
+        found, missed_keys = RequestCache.get_many(keys)
+        objects = {keys[key]: obj for key, obj in found.items() if obj is not None}
+        if not missed_keys:
+            return objects
+
+        # hot objects are kept in process local cache
+        use_local_cache = cls._use_local_cache(model_class)
+        local_objects = {}
+        if use_local_cache:
+            for key in missed_keys:
+                hit, obj = LocalCache.get(key)
+                if hit:
+                    local_objects[key] = obj
+            missed_keys = [key for key in missed_keys if key not in local_objects]
+
+        # cache hit
+        cached = project_memcached.get_many(missed_keys) if missed_keys else {}
+        cached = {key: cls.from_cached(obj) for key, obj in cached.items()}
 
         # cache miss
-        obj = model_class.objects.filter(id=object_id).first()
-        if obj:
-            project_memcached.set(key, obj)
+        missed_keys_in_memcached = [key for key in missed_keys if key not in cached]
+        if missed_keys_in_memcached:
+            missed_objects = {
+                cls._get_key(model_class, obj.id): obj
+                for obj in model_class.objects.filter(id__in=[keys[key] for key in missed_keys_in_memcached])
+            }
+            # objects not found are cached as NOT_FOUND
+            missed_objects = {key: missed_objects.get(key) for key in missed_keys_in_memcached}
+            cls.set_loaded_objects(missed_objects)
+            cached.update(missed_objects)
 
-        return obj
+        if use_local_cache:
+            LocalCache.set_many({key: obj for key, obj in cached.items() if obj is not None})
+        # not found objects are kept as None in request cache
+        RequestCache.set_many(local_objects)
+        RequestCache.set_many(cached)
+        objects.update({keys[key]: obj for key, obj in local_objects.items()})
+        objects.update({keys[key]: obj for key, obj in cached.items() if obj is not None})
+        return objects
+
+    @classmethod
+    def prefetch_objects_in_memcached(cls, context, model_class, object_ids):
+        # objects read by get_prefetched_object, objects not found are left out
+        prefetched = context.setdefault(PREFETCHED_OBJECTS, {}).setdefault(model_class, {})
+        object_ids = {
+            object_id
+            for object_id in object_ids
+            if object_id is not None and object_id not in prefetched
+        }
+        prefetched.update(cls.get_objects_in_memcached(model_class, object_ids))
+        return prefetched
+
+    @classmethod
+    def get_prefetched_object(cls, context, model_class, object_id):
+        prefetched = context.get(PREFETCHED_OBJECTS, {}).get(model_class, {})
+        if object_id in prefetched:
+            return prefetched[object_id]
+        return cls.get_object_in_memcached(model_class, object_id)
 
     @classmethod
     def invalidate_object_in_memcached(cls, model_class, object_id):
         key = cls._get_key(model_class, object_id)
         project_memcached.delete(key)
+        RequestCache.delete(key)
+        if cls._use_local_cache(model_class):
+            LocalCache.invalidate(key)
 
 
 def invalidate_object_in_memcached(sender, instance, **kwargs):
@@ -0,0 +1,77 @@
+from contextvars import ContextVar
+
+
+class RequestCacheData:
+    def __init__(self):
+        # memcached key => object, None is kept too, means object not exists
+        self.objects = {}
+        self.hits = 0
+        self.misses = 0
+
+
+_request_cache = ContextVar('request_cache', default=None)
+
+
+# identity map in front of memcached, each object is fetched at most once per request.
+# it is only active between start and stop, see utils.middlewares.RequestCacheMiddleware,
+# out of a request (celery, shell) every call passes through to memcached.
+class RequestCache:
+
+    @classmethod
+    def start(cls):
+        return _request_cache.set(RequestCacheData())
+
+    @classmethod
+    def stop(cls, token):
+        _request_cache.reset(token)
+
+    @classmethod
+    def is_active(cls):
+        return _request_cache.get() is not None
+
+    @classmethod
+    def get(cls, key):
+        """
+        => (hit, object)
+        """
+        found, _ = cls.get_many([key])
+        if key in found:
+            return True, found[key]
+        return False, None
+
+    @classmethod
+    def get_many(cls, keys):
+        """
+        => ({key: object}, [missed keys])
+        """
+        data = _request_cache.get()
+        if data is None:
+            return {}, list(keys)
+        found, missed_keys = {}, []
+        for key in keys:
+            if key in data.objects:
+                found[key] = data.objects[key]
+            else:
+                missed_keys.append(key)
+        data.hits += len(found)
+        data.misses += len(missed_keys)
+        return found, missed_keys
+
+    @classmethod
+    def set_many(cls, objects):
+        data = _request_cache.get()
+        if data is not None:
+            data.objects.update(objects)
+
+    @classmethod
+    def delete(cls, key):
+        data = _request_cache.get()
+        if data is not None:
+            data.objects.pop(key, None)
+
+    @classmethod
+    def get_stats(cls):
+        data = _request_cache.get()
+        if data is None:
+            return {'hits': 0, 'misses': 0}
+        return {'hits': data.hits, 'misses': data.misses}
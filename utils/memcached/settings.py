@@ -14,3 +14,23 @@ CACHES = {
         'KEY_PREFIX': 'testing' if ((" ".join(sys.argv)).find('manage.py test') != -1) else ''
     },
 }
+
+# process local near cache in front of memcached, only for models listed here.
+# objects in it are shared by all requests of the process, never modify them.
+# invalidations are sent through redis pub/sub, ttl bounds staleness if one is lost.
+LOCAL_CACHE_MODELS = ('User', 'Tweet')
+LOCAL_CACHE_SIZE = 10000
+LOCAL_CACHE_TTL = 10  # in seconds
+LOCAL_CACHE_CHANNEL = 'local_cache_invalidation' if ((" ".join(sys.argv)).find('manage.py test') == -1) else 'testing_local_cache_invalidation'
+
+# lock of MemcachedHelper.load_with_lock, a missed object is loaded by its holder only
+MEMCACHED_LOCK_TIMEOUT = 5  # in seconds
+MEMCACHED_LOCK_RETRIES = 20
+MEMCACHED_LOCK_WAIT = 0.05  # in seconds
+
+# objects not exist are cached as NOT_FOUND for a short time
+MEMCACHED_NOT_FOUND_TIMEOUT = 60  # in seconds
+
+# to_users of who follows at most this many users are cached as one set in hbase mode,
+# has_followed of others is a point lookup in HBaseFriendshipEdge
+MEMCACHED_TO_USERS_LIMIT = 1000
@@ -0,0 +1,115 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.utils import override_settings
+from tweets.models import Tweet
+from utils.memcached.local_cache import LocalCache
+from utils.memcached.memcached_helper import MemcachedHelper, project_memcached
+from utils.memcached.request_cache import RequestCache
+from utils.test_helpers import TestHelpers
+
+
+class MemcachedHelperTests(TestCase):
+
+    def setUp(self):
+        TestHelpers.clear_cache()
+        self.user = TestHelpers.create_user()
+
+    def test_request_cache(self):
+        # not in a request, pass through to memcached
+        self.assertFalse(RequestCache.is_active())
+        self.assertEqual(MemcachedHelper.get_object_in_memcached(User, self.user.id), self.user)
+
+        token = RequestCache.start()
+        try:
+            user = MemcachedHelper.get_object_in_memcached(User, self.user.id)
+            self.assertEqual(RequestCache.get_stats(), {'hits': 0, 'misses': 1})
+
+            # same object in the same request
+            self.assertIs(MemcachedHelper.get_object_in_memcached(User, self.user.id), user)
+            self.assertEqual(
+                MemcachedHelper.get_objects_in_memcached(User, [self.user.id]),
+                {self.user.id: user},
+            )
+            self.assertEqual(RequestCache.get_stats(), {'hits': 2, 'misses': 1})
+
+            # not found object is fetched once
+            with self.assertNumQueries(1):
+                self.assertIsNone(MemcachedHelper.get_object_in_memcached(User, 0))
+                self.assertIsNone(MemcachedHelper.get_object_in_memcached(User, 0))
+
+            # invalidated object is fetched again
+            self.user.username = 'new admin'
+            self.user.save()
+            user = MemcachedHelper.get_object_in_memcached(User, self.user.id)
+            self.assertEqual(user.username, 'new admin')
+        finally:
+            RequestCache.stop(token)
+        self.assertFalse(RequestCache.is_active())
+
+    def test_local_cache(self):
+        user = MemcachedHelper.get_object_in_memcached(User, self.user.id)
+
+        # hit in local cache even memcached lost the object
+        project_memcached.clear()
+        with self.assertNumQueries(0):
+            self.assertIs(MemcachedHelper.get_object_in_memcached(User, self.user.id), user)
+
+        # invalidated by save
+        self.user.username = 'new admin'
+        self.user.save()
+        self.assertEqual(MemcachedHelper.get_object_in_memcached(User, self.user.id).username, 'new admin')
+
+        # expired by ttl
+        with override_settings(LOCAL_CACHE_TTL=-1):
+            LocalCache.clear()
+            MemcachedHelper.get_object_in_memcached(User, self.user.id)
+            self.assertEqual(LocalCache.get(f'User:{self.user.id}'), (False, None))
+
+        # least recently used object is evicted
+        other = TestHelpers.create_user(username='other', email='other@admin.com')
+        with override_settings(LOCAL_CACHE_SIZE=1):
+            LocalCache.clear()
+            MemcachedHelper.get_objects_in_memcached(User, [self.user.id, other.id])
+            self.assertEqual(list(LocalCache.data), [f'User:{other.id}'])
+
+    def test_load_with_lock(self):
+        key = f'User:{self.user.id}'
+        with self.assertNumQueries(1):
+            user = MemcachedHelper.load_with_lock(key, lambda: User.objects.get(id=self.user.id))
+        self.assertEqual(project_memcached.get(key), user)
+        self.assertIsNone(project_memcached.get(f'lock:{key}'))
+
+        # lock expired while loading and taken by another worker is not released
+        def load_object():
+            project_memcached.set(f'lock:{key}', 'other')
+            return user
+
+        MemcachedHelper.load_with_lock(key, load_object)
+        self.assertEqual(project_memcached.get(f'lock:{key}'), 'other')
+        project_memcached.delete(f'lock:{key}')
+
+        # lock is held by another worker, wait for the cache instead of loading
+        project_memcached.add(f'lock:{key}', 1)
+        with override_settings(MEMCACHED_LOCK_WAIT=0), self.assertNumQueries(0):
+            self.assertEqual(MemcachedHelper.load_with_lock(key, lambda: User.objects.get(id=self.user.id)), user)
+
+    def test_not_found(self):
+        # dangling reference costs one query, then one cache hit
+        with self.assertNumQueries(1):
+            self.assertIsNone(MemcachedHelper.get_object_in_memcached(User, 0))
+            self.assertIsNone(MemcachedHelper.get_object_in_memcached(User, 0))
+            self.assertEqual(MemcachedHelper.get_objects_in_memcached(User, [0]), {})
+        with self.assertNumQueries(1):
+            self.assertEqual(MemcachedHelper.get_objects_in_memcached(User, [-1, self.user.id]), {
+                self.user.id: self.user,
+            })
+            self.assertIsNone(MemcachedHelper.get_object_in_memcached(User, -1))
+
+        # deleted object
+        tweet = TestHelpers.create_tweet(self.user)
+        tweet_id = tweet.id
+        self.assertEqual(MemcachedHelper.get_object_in_memcached(Tweet, tweet_id), tweet)
+        tweet.delete()
+        with self.assertNumQueries(1):
+            self.assertIsNone(MemcachedHelper.get_object_in_memcached(Tweet, tweet_id))
+            self.assertIsNone(MemcachedHelper.get_object_in_memcached(Tweet, tweet_id))
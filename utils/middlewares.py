@@ -1,4 +1,6 @@
+from django.conf import settings
 from time import time
+from utils.memcached.request_cache import RequestCache
 
 class ReportTimeMiddleware:
     def __init__(self, get_response):
@@ -9,4 +11,25 @@ class ReportTimeMiddleware:
         response = self.get_response(request)
         end_time = time()
         # print(end_time - start_time)
-        return response
\ No newline at end of file
+        return response
+
+
+class RequestCacheMiddleware:
+    """
+    objects read from memcached are kept in RequestCache until the response is returned.
+    hit and miss counters are in response headers in DEBUG mode.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = RequestCache.start()
+        try:
+            response = self.get_response(request)
+            if settings.DEBUG:
+                stats = RequestCache.get_stats()
+                response['X-Request-Cache-Hits'] = stats['hits']
+                response['X-Request-Cache-Misses'] = stats['misses']
+        finally:
+            RequestCache.stop(token)
+        return response
@@ -14,39 +14,36 @@ class EndlessPagination(BasePagination):
     def to_html(self):
         pass
 
-    def _pagination_ordered_list(self, request, objects):
+    def _parse_created_at(self, value):
+        # datetime for mysql objects, int timestamp for hbase objects
+        try:
+            return parser.isoparse(value)
+        except ValueError:
+            return int(value)
+
+    def paginate_cached_page(self, request, get_cached_page):
+        """
+        only objects of the page are read from cache
+        get_cached_page(created_at__lt=None, created_at__gt=None, size=None)
+            => (objects of page, number of cached entries of page, length of cached list)
+        """
+        # if page-up, this will anyway get the newest list
         if 'created_at__gt' in request.query_params:
-            try:
-                created_at__gt = parser.isoparse(request.query_params['created_at__gt'])
-            except ValueError:
-                created_at__gt = int(request.query_params['created_at__gt'])
+            created_at__gt = self._parse_created_at(request.query_params['created_at__gt'])
+            objects, _, _ = get_cached_page(created_at__gt=created_at__gt)
             self.has_next_page = False
-            return [obj for obj in objects if obj.created_at > created_at__gt]
+            return objects
 
-        idx = 0
+        created_at__lt = None
         if 'created_at__lt' in request.query_params:
-            try:
-                created_at__lt = parser.isoparse(request.query_params['created_at__lt'])
-            except ValueError:
-                created_at__lt = int(request.query_params['created_at__lt'])
-            for idx, obj in enumerate(objects):
-                if obj.created_at < created_at__lt:
-                    break
-
-        self.has_next_page = len(objects) > idx + self.page_size
-        return objects[idx : idx + self.page_size]
-
-    def paginate_cached_list(self, request, cached_list):
-        paginated_list = self._pagination_ordered_list(request, cached_list)
-        # if page-up, this will anyway get the newest list
-        if 'created_at__gt' in request.query_params:
-            return paginated_list
+            created_at__lt = self._parse_created_at(request.query_params['created_at__lt'])
+        objects, entries_count, cached_length = get_cached_page(created_at__lt=created_at__lt, size=self.page_size + 1)
+        # entries of deleted objects are dropped from objects, but still count for next page
+        self.has_next_page = entries_count > self.page_size
         # if has_next_page, this means this page is fulfill this request
-        if self.has_next_page:
-            return paginated_list
         # if cache list not full, means all objects are loaded from DB anyway.
-        if len(cached_list) < settings.REDIS_LIST_LENGTH_LIMIT:
-            return paginated_list
+        if self.has_next_page or cached_length < settings.REDIS_LIST_LENGTH_LIMIT:
+            return objects[:self.page_size]
         # otherwise, cached list is not fulfill the page, need to reload from DB
         return None
 
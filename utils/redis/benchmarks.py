@@ -0,0 +1,48 @@
+"""
+micro benchmarks of redis serializers, no redis server needed
+    python manage.py shell -c "from utils.redis.benchmarks import run; run()"
+"""
+from tweets.models import Tweet
+from tweets.redis_serializers import TweetIdSerializer, TweetStructSerializer
+from utils import helpers
+from utils.redis.redis_serializers import DjangoModelSerializer
+import time
+
+
+def _ops_per_second(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return int(len(items) / (time.perf_counter() - start))
+
+
+def benchmark_serializer(serializer, tweets):
+    serialized_list = [serializer.serialize(tweet) for tweet in tweets]
+    return {
+        'serialize': _ops_per_second(serializer.serialize, tweets),
+        'deserialize': _ops_per_second(serializer.deserialize, serialized_list),
+        'bytes': sum(len(data) for data in serialized_list) // len(serialized_list),
+    }
+
+
+def run(size=10000):
+    now = helpers.utc_now()
+    tweets = [
+        Tweet(
+            id=i,
+            user_id=i % 100,
+            content=f'tweet content {i}',
+            created_at=now,
+            likes_count=i % 10,
+            comments_count=i % 5,
+        )
+        for i in range(1, size + 1)
+    ]
+    for serializer in (DjangoModelSerializer, TweetStructSerializer, TweetIdSerializer):
+        result = benchmark_serializer(serializer, tweets)
+        print(
+            f'{serializer.__name__}: '
+            f'serialize {result["serialize"]} ops/sec, '
+            f'deserialize {result["deserialize"]} ops/sec, '
+            f'{result["bytes"]} bytes/object'
+        )
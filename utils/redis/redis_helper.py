@@ -1,116 +1,898 @@
+from collections import defaultdict
+from contextlib import contextmanager
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from utils import helpers
 from utils.redis.redis_client import RedisClient
 from utils.redis.redis_serializers import DjangoModelSerializer, HBaseModelSerializer
+import time
+import uuid
 
 USER_TWEETS_PATTERN = 'user_tweets:{user_id}'
 USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
+USER_TWEETS_ZSET_PATTERN = 'user_tweets_zset:{user_id}'
+USER_NEWSFEEDS_ZSET_PATTERN = 'user_newsfeeds_zset:{user_id}'
+USER_LIKED_PATTERN = 'user_liked_{model_name}:{user_id}'
+OBJECT_LIKERS_PATTERN = 'object_likers_{model_name}:{object_id}'
+# all counts of an object are kept in one hash, {attr: count}
+COUNTS_PATTERN = '{model_name}:{object_id}'
+COUNT_DELTAS_PATTERN = 'count_deltas:{model_name}'
+COUNT_DELTAS_PROCESSING_PATTERN = 'count_deltas_processing:{model_name}'
+LOCK_PATTERN = 'lock:{key}'
+# changes of a set not cached, {member: '1' added or '0' removed}, applied by the next load
+SET_JOURNAL_PATTERN = 'journal:{key}'
+
+# key in serializer context, {model class: {object id: {attr: count}}}
+PREFETCHED_COUNTS = 'prefetched_counts'
+
+# an empty set is not kept by redis, every cached set has this member so it exists
+SET_PLACEHOLDER = ''
+# a set with more members than its limit is cached as this marker only
+SET_OVERFLOW = '*'
+
+# timeline stores, selected per timeline type by REDIS_TIMELINE_STORES in settings
+LIST_STORE = 'list'
+ZSET_STORE = 'zset'
+
+# timeline entries, selected by REDIS_TIMELINE_ENTRIES in settings
+OBJECT_ENTRIES = 'objects'
+ID_ENTRIES = 'ids'
+
+# codec of object entries, selected by REDIS_OBJECT_SERIALIZER in settings
+JSON_SERIALIZER = 'json'
+STRUCT_SERIALIZER = 'struct'
+
+# KEYS[1]: list key, ARGV[1]: expire time, ARGV[2:]: serialized objects
+# only the first loader fills the list, concurrent loaders will not duplicate objects
+LOAD_LIST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS[1]: list key, ARGV[1]: list length limit, ARGV[2]: serialized object
+# return 0 if list not cached, caller should load list from DB
+EXTEND_LIST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[2])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+return 1
+"""
+
+# KEYS[1]: list key, ARGV[1]: offset of created_at packed as 8 bytes in entries,
+# ARGV[2]: created_at__lt or '', ARGV[3]: created_at__gt or '', ARGV[4]: size, -1 if no size
+# => {length of list, entries of page}, the cursor is found by binary search in one round trip
+READ_PAGE_SCRIPT = """
+local length = redis.call('LLEN', KEYS[1])
+if length == 0 then
+    return {0, {}}
+end
+local offset = tonumber(ARGV[1])
+-- first index in [0, length) older than created_at, or not newer if or_equal
+local function bisect(created_at, or_equal)
+    local lo, hi = 0, length
+    while lo < hi do
+        local mid = math.floor((lo + hi) / 2)
+        local entry_created_at = struct.unpack('>i8', redis.call('LINDEX', KEYS[1], mid), offset + 1)
+        if entry_created_at < created_at or (or_equal and entry_created_at == created_at) then
+            hi = mid
+        else
+            lo = mid + 1
+        end
+    end
+    return lo
+end
+local start, stop = 0, -1
+if ARGV[3] ~= '' then
+    stop = bisect(tonumber(ARGV[3]), true) - 1
+    if stop < 0 then
+        return {length, {}}
+    end
+else
+    if ARGV[2] ~= '' then
+        start = bisect(tonumber(ARGV[2]), false)
+    end
+    if tonumber(ARGV[4]) >= 0 then
+        stop = start + tonumber(ARGV[4]) - 1
+    end
+end
+return {length, redis.call('LRANGE', KEYS[1], start, stop)}
+"""
+
+# KEYS[1]: zset key, ARGV[1]: expire time, ARGV[2:]: score, serialized object, score, ...
+LOAD_ZSET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS[1]: zset key, ARGV[1]: zset size limit, ARGV[2]: score, ARGV[3]: serialized object
+# same object added twice is kept once, lowest scores are trimmed out of limit
+EXTEND_ZSET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+return 1
+"""
+
+# KEYS[1]: set key, KEYS[2]: journal key, ARGV[1]: expire time, ARGV[2]: overflow marker, ARGV[3:]: members
+# members are added in chunks, lua cannot unpack more than about 8000 values at once.
+# changes made while members were read from db are kept in journal and applied after them
+LOAD_SET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+for i = 3, #ARGV, 1000 do
+    redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+if redis.call('SISMEMBER', KEYS[1], ARGV[2]) == 0 then
+    local journal = redis.call('HGETALL', KEYS[2])
+    for i = 1, #journal, 2 do
+        if journal[i + 1] == '1' then
+            redis.call('SADD', KEYS[1], journal[i])
+        else
+            redis.call('SREM', KEYS[1], journal[i])
+        end
+    end
+end
+redis.call('DEL', KEYS[2])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS[1]: set key, KEYS[2]: journal key, ARGV[1]: member, ARGV[2]: '1' to add or '0' to remove,
+# ARGV[3]: size limit, -1 if no limit, ARGV[4]: journal expire time, ARGV[5]: placeholder, ARGV[6]: overflow marker
+# change of a set not cached is kept in journal for a loader reading db meanwhile, return 0.
+# overflowed set keeps only the marker, a set growing over limit is replaced by the marker
+UPDATE_SET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+    return 0
+end
+if redis.call('SISMEMBER', KEYS[1], ARGV[6]) == 1 then
+    return 0
+end
+if ARGV[2] == '0' then
+    redis.call('SREM', KEYS[1], ARGV[1])
+    return 1
+end
+redis.call('SADD', KEYS[1], ARGV[1])
+local limit = tonumber(ARGV[3])
+-- placeholder is not counted
+if limit >= 0 and redis.call('SCARD', KEYS[1]) > limit + 1 then
+    local ttl = redis.call('TTL', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    redis.call('SADD', KEYS[1], ARGV[5], ARGV[6])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[1], ttl)
+    end
+end
+return 1
+"""
+
+# KEYS[1]: counts hash key, KEYS[2]: deltas hash key, ARGV[1]: deltas field, ARGV[2]: delta, ARGV[3]: attr
+# delta is always recorded to be flushed to db, return nil if count not cached
+INCR_COUNT_SCRIPT = """
+redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[2])
+if redis.call('HEXISTS', KEYS[1], ARGV[3]) == 0 then
+    return false
+end
+return redis.call('HINCRBY', KEYS[1], ARGV[3], ARGV[2])
+"""
+
+# KEYS[1]: counts hash key, ARGV[1]: expire time, ARGV[2:]: attr and count pairs
+# counts set by a concurrent loader or incr are kept, expire time is set only on a new hash
+# => stored counts of the attrs
+LOAD_COUNTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+else
+    for i = 2, #ARGV, 2 do
+        redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+local counts = {}
+for i = 2, #ARGV, 2 do
+    counts[#counts + 1] = redis.call('HGET', KEYS[1], ARGV[i])
+end
+return counts
+"""
+
+# KEYS[1]: deltas hash key, KEYS[2]: processing hash key
+# deltas left in processing by a failed flush are flushed again before new deltas
+START_FLUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 1
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+return 1
+"""
+
+# KEYS[1]: lock key, ARGV[1]: token of lock holder
+# a lock expired and taken by another worker is not released
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
 
 class RedisHelper:
+    _scripts = {}
+
+    @classmethod
+    def _run_script(cls, script, keys, args, client=None):
+        # script is registered once and executed by EVALSHA, in a pipeline if client is one
+        if script not in cls._scripts:
+            cls._scripts[script] = RedisClient.get_connection().register_script(script)
+        return cls._scripts[script](keys=keys, args=args, client=client)
 
     @classmethod
-    def get_objects_in_redis_from_sql(cls, key, queryset):
+    def _load_with_lock(cls, key, load, read_cached):
+        """
+        single flight of a cache miss, only the worker holding the lock calls load,
+        which loads objects from DB and fills redis. others wait and read_cached again,
+        if redis is not filled in time, they load themselves.
+        read_cached() => same result as load(), None if not cached
+        """
+        with cls._hold_lock(key, settings.REDIS_LOCK_TIMEOUT) as locked:
+            if locked:
+                return load()
+
         conn = RedisClient.get_connection()
+        lock_key = LOCK_PATTERN.format(key=key)
+        for _ in range(settings.REDIS_LOCK_RETRIES):
+            time.sleep(settings.REDIS_LOCK_WAIT)
+            result = read_cached()
+            if result is not None:
+                return result
+            # lock holder found nothing to cache
+            if not conn.exists(lock_key):
+                break
+        return load()
 
-        # if redis hit
-        if conn.exists(key):
-            serialized_list = conn.lrange(key, 0, -1)
-            return [DjangoModelSerializer.deserialize(obj_data) for obj_data in serialized_list]
+    @classmethod
+    @contextmanager
+    def _hold_lock(cls, key, timeout, retries=0, wait=0):
+        """
+        => True in the block if lock is held, it expires after timeout if the holder dies,
+        and is released only by its holder
+        """
+        conn = RedisClient.get_connection()
+        lock_key = LOCK_PATTERN.format(key=key)
+        token = uuid.uuid4().hex
+        for retry in range(retries + 1):
+            if conn.set(lock_key, token, nx=True, ex=timeout):
+                break
+            if retry < retries:
+                time.sleep(wait)
+        else:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            cls._run_script(RELEASE_LOCK_SCRIPT, keys=[lock_key], args=[token])
 
-        # when not hit, load objects into redis
-        objects = list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
-        serialized_list = [DjangoModelSerializer.serialize(obj) for obj in objects]
+    @classmethod
+    def _load_objects_to_redis(cls, key, objects, serializer):
+        serialized_list = [serializer.serialize(obj) for obj in objects]
         if serialized_list:
-            conn.rpush(key, *serialized_list)
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-        return objects
+            cls._run_script(
+                LOAD_LIST_SCRIPT,
+                keys=[key],
+                args=[settings.REDIS_KEY_EXPIRE_TIME, *serialized_list],
+            )
 
     @classmethod
-    def get_objects_in_redis_from_hbase(cls, key, query_func):
-        conn = RedisClient.get_connection()
+    def _read_objects_in_redis(cls, key, serializer):
+        # if redis hit, empty list never exists in redis, so one LRANGE is enough
+        serialized_list = RedisClient.get_connection().lrange(key, 0, -1)
+        if not serialized_list:
+            return None
+        return serializer.hydrate([serializer.deserialize(obj_data) for obj_data in serialized_list])
 
-        # if redis hit
-        if conn.exists(key):
-            serialized_list = conn.lrange(key, 0, -1)
-            return [HBaseModelSerializer.deserialize(obj_data) for obj_data in serialized_list]
+    @classmethod
+    def _get_objects_in_redis(cls, key, load_objects, serializer):
+        objects = cls._read_objects_in_redis(key, serializer)
+        if objects is not None:
+            return objects
 
         # when not hit, load objects into redis
-        objects = query_func(settings.REDIS_LIST_LENGTH_LIMIT)
-        serialized_list = [HBaseModelSerializer.serialize(obj) for obj in objects]
-        if serialized_list:
-            conn.rpush(key, *serialized_list)
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        def load():
+            objects = load_objects(settings.REDIS_LIST_LENGTH_LIMIT)
+            cls._load_objects_to_redis(key, objects, serializer)
+            return objects
+
+        return cls._load_with_lock(key, load, lambda: cls._read_objects_in_redis(key, serializer))
+
+    @classmethod
+    def _extend_object_in_redis(cls, key, obj, load_objects, serializer):
+        # if redis hit, push and trim in one atomic round trip
+        if cls._run_script(
+            EXTEND_LIST_SCRIPT,
+            keys=[key],
+            args=[settings.REDIS_LIST_LENGTH_LIMIT, serializer.serialize(obj)],
+        ):
+            return
+
+        # if not hit, load from DB
+        objects = load_objects(settings.REDIS_LIST_LENGTH_LIMIT)
+        cls._load_objects_to_redis(key, objects, serializer)
+
+    @classmethod
+    def _bisect(cls, is_after, lo, hi):
+        # first index in [lo, hi) where is_after(index) is True, is_after must be monotone
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if is_after(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    @classmethod
+    def _slice_page(cls, objects, created_at__lt=None, created_at__gt=None, size=None):
+        # objects are ordered by created_at desc
+        if created_at__gt is not None:
+            objects = [obj for obj in objects if obj.created_at > created_at__gt]
+        if created_at__lt is not None:
+            objects = [obj for obj in objects if obj.created_at < created_at__lt]
+        if size is not None:
+            objects = objects[:size]
         return objects
 
     @classmethod
-    def extend_object_in_redis_from_sql(cls, key, obj, queryset):
+    def _get_page_in_redis(cls, key, load_objects, serializer, created_at__lt=None, created_at__gt=None, size=None):
+        """
+        read only the objects of one page from cached list, list is ordered by created_at desc.
+        position of the cursor is found by binary search with LINDEX, then the page is read by LRANGE,
+        in one script if created_at is packed in entries.
+        return (objects of page, number of cached entries of page, length of cached list),
+        entries of deleted objects are read but dropped by hydrate
+        """
+        read_cached = lambda: cls._read_page_in_redis(key, serializer, created_at__lt, created_at__gt, size)
+        result = read_cached()
+        if result is not None:
+            return result
+
+        # when not hit, load objects into redis and slice the page from loaded objects
+        def load():
+            objects = load_objects(settings.REDIS_LIST_LENGTH_LIMIT)
+            cls._load_objects_to_redis(key, objects, serializer)
+            page = cls._slice_page(objects, created_at__lt, created_at__gt, size)
+            return page, len(page), len(objects)
+
+        return cls._load_with_lock(key, load, read_cached)
+
+    @classmethod
+    def _read_page_in_redis(cls, key, serializer, created_at__lt, created_at__gt, size):
+        # => (objects of page, number of cached entries of page, length of cached list), None if not cached
+        if serializer.created_at_offset is None:
+            cached_length, serialized_list = cls._search_page_in_redis(
+                key, serializer, created_at__lt, created_at__gt, size)
+        else:
+            cached_length, serialized_list = cls._run_script(
+                READ_PAGE_SCRIPT,
+                keys=[key],
+                args=[
+                    serializer.created_at_offset,
+                    '' if created_at__lt is None else cls.get_score(created_at__lt),
+                    '' if created_at__gt is None else cls.get_score(created_at__gt),
+                    -1 if size is None else size,
+                ],
+            )
+        if cached_length == 0:
+            return None
+        objects = [serializer.deserialize(obj_data) for obj_data in serialized_list]
+        objects = cls._slice_page(objects, created_at__lt, created_at__gt, size)
+        return serializer.hydrate(objects), len(objects), cached_length
+
+    @classmethod
+    def _search_page_in_redis(cls, key, serializer, created_at__lt, created_at__gt, size):
+        """
+        for entries created_at can not be read from without deserializing, e.g. json.
+        each step of binary search is one LINDEX round trip and one deserialize.
+        => (length of cached list, entries of page)
+        """
         conn = RedisClient.get_connection()
+        cached_length = conn.llen(key)
+        if cached_length == 0:
+            return 0, []
 
-        # if redis hit
-        if conn.exists(key):
-            serialized_obj = DjangoModelSerializer.serialize(obj)
-            conn.lpush(key, serialized_obj)
-            conn.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
-            return
+        def is_older(idx, created_at, or_equal=False):
+            obj_data = conn.lindex(key, idx)
+            # list is expired or trimmed while searching
+            if obj_data is None:
+                return True
+            obj_created_at = serializer.deserialize(obj_data).created_at
+            if or_equal:
+                return obj_created_at <= created_at
+            return obj_created_at < created_at
 
-        # if not hit, load from DB
-        objects = list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
-        serialized_list = [DjangoModelSerializer.serialize(obj) for obj in objects]
-        if serialized_list:
-            conn.rpush(key, *serialized_list)
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        start = 0
+        if created_at__gt is not None:
+            # objects from head until the first one not newer than created_at__gt
+            stop = cls._bisect(lambda idx: is_older(idx, created_at__gt, or_equal=True), 0, cached_length) - 1
+            if stop < 0:
+                return cached_length, []
+        else:
+            if created_at__lt is not None:
+                start = cls._bisect(lambda idx: is_older(idx, created_at__lt), 0, cached_length)
+            # read one more object in case a new object is pushed to head while searching
+            stop = -1 if size is None else start + size
+        return cached_length, conn.lrange(key, start, stop)
+
+    @classmethod
+    def get_timeline_key(cls, pattern, zset_pattern, store, serializer, **kwargs):
+        # timelines cached by different serializers never share keys
+        key = (zset_pattern if store == ZSET_STORE else pattern).format(**kwargs)
+        return key + serializer.key_suffix
+
+    @classmethod
+    def get_score(cls, created_at):
+        # microsecond timestamp, same as packed in entries, hbase objects already use it as created_at
+        if isinstance(created_at, int):
+            return created_at
+        return helpers.datetime_to_timestamp(created_at)
+
+    @classmethod
+    def _load_objects_to_zset(cls, key, objects, serializer):
+        args = []
+        for obj in objects:
+            args += [cls.get_score(obj.created_at), serializer.serialize(obj)]
+        if args:
+            cls._run_script(
+                LOAD_ZSET_SCRIPT,
+                keys=[key],
+                args=[settings.REDIS_KEY_EXPIRE_TIME, *args],
+            )
 
     @classmethod
-    def extend_object_in_redis_from_hbase(cls, key, obj, query_func):
+    def _get_page_in_zset(cls, key, load_objects, serializer, created_at__lt=None, created_at__gt=None, size=None):
+        """
+        same as _get_page_in_redis, but the timeline is a zset scored by created_at.
+        the page is read by ZREVRANGEBYSCORE with LIMIT, one round trip when hit.
+        return (objects of page, number of cached entries of page, size of cached zset)
+        """
+        read_cached = lambda: cls._read_page_in_zset(key, serializer, created_at__lt, created_at__gt, size)
+        result = read_cached()
+        if result is not None:
+            return result
+
+        # when not hit, load objects into redis and slice the page from loaded objects
+        def load():
+            objects = load_objects(settings.REDIS_LIST_LENGTH_LIMIT)
+            cls._load_objects_to_zset(key, objects, serializer)
+            page = cls._slice_page(objects, created_at__lt, created_at__gt, size)
+            return page, len(page), len(objects)
+
+        return cls._load_with_lock(key, load, read_cached)
+
+    @classmethod
+    def _read_page_in_zset(cls, key, serializer, created_at__lt, created_at__gt, size):
+        # => (objects of page, number of cached entries of page, size of cached zset), None if not cached
         conn = RedisClient.get_connection()
+        # '(' means exclusive
+        max_score = '+inf' if created_at__lt is None else f'({cls.get_score(created_at__lt)}'
+        min_score = '-inf' if created_at__gt is None else f'({cls.get_score(created_at__gt)}'
+        pipe = conn.pipeline(transaction=False)
+        pipe.zcard(key)
+        if size is None:
+            pipe.zrevrangebyscore(key, max_score, min_score)
+        else:
+            pipe.zrevrangebyscore(key, max_score, min_score, start=0, num=size)
+        cached_length, serialized_list = pipe.execute()
+        if cached_length == 0:
+            return None
+        objects = [serializer.deserialize(obj_data) for obj_data in serialized_list]
+        return serializer.hydrate(objects), len(objects), cached_length
 
-        # if redis hit
-        if conn.exists(key):
-            serialized_obj = HBaseModelSerializer.serialize(obj)
-            conn.lpush(key, serialized_obj)
-            conn.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+    @classmethod
+    def _extend_object_in_zset(cls, key, obj, load_objects, serializer):
+        # if redis hit, add and trim in one atomic round trip
+        if cls._run_script(
+            EXTEND_ZSET_SCRIPT,
+            keys=[key],
+            args=[settings.REDIS_LIST_LENGTH_LIMIT, cls.get_score(obj.created_at), serializer.serialize(obj)],
+        ):
             return
 
         # if not hit, load from DB
-        objects = query_func(settings.REDIS_LIST_LENGTH_LIMIT)
-        serialized_list = [HBaseModelSerializer.serialize(obj) for obj in objects]
-        if serialized_list:
-            conn.rpush(key, *serialized_list)
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        objects = load_objects(settings.REDIS_LIST_LENGTH_LIMIT)
+        cls._load_objects_to_zset(key, objects, serializer)
 
     @classmethod
-    def get_count_key(cls, obj, attr):
-        return f'{obj.__class__.__name__}.{attr}:{obj.id}'
+    def _get_timeline_objects(cls, key, load_objects, serializer, store):
+        if store == ZSET_STORE:
+            return cls._get_page_in_zset(key, load_objects, serializer)[0]
+        return cls._get_objects_in_redis(key, load_objects, serializer)
 
     @classmethod
-    def incr_count_in_redis(cls, obj, attr):
+    def _get_timeline_page(cls, key, load_objects, serializer, store, **kwargs):
+        if store == ZSET_STORE:
+            return cls._get_page_in_zset(key, load_objects, serializer, **kwargs)
+        return cls._get_page_in_redis(key, load_objects, serializer, **kwargs)
+
+    @classmethod
+    def _extend_timeline(cls, key, obj, load_objects, serializer, store):
+        if store == ZSET_STORE:
+            return cls._extend_object_in_zset(key, obj, load_objects, serializer)
+        return cls._extend_object_in_redis(key, obj, load_objects, serializer)
+
+    @classmethod
+    def get_objects_in_redis_from_sql(cls, key, queryset, store=LIST_STORE, serializer=DjangoModelSerializer):
+        load_objects = lambda limit: list(queryset[:limit])
+        return cls._get_timeline_objects(key, load_objects, serializer, store)
+
+    @classmethod
+    def get_objects_in_redis_from_hbase(cls, key, query_func, store=LIST_STORE, serializer=HBaseModelSerializer):
+        return cls._get_timeline_objects(key, query_func, serializer, store)
+
+    @classmethod
+    def get_page_in_redis_from_sql(cls, key, queryset, store=LIST_STORE, serializer=DjangoModelSerializer, **kwargs):
+        load_objects = lambda limit: list(queryset[:limit])
+        return cls._get_timeline_page(key, load_objects, serializer, store, **kwargs)
+
+    @classmethod
+    def get_page_in_redis_from_hbase(cls, key, query_func, store=LIST_STORE, serializer=HBaseModelSerializer, **kwargs):
+        return cls._get_timeline_page(key, query_func, serializer, store, **kwargs)
+
+    @classmethod
+    def extend_object_in_redis_from_sql(cls, key, obj, queryset, store=LIST_STORE, serializer=DjangoModelSerializer):
+        load_objects = lambda limit: list(queryset[:limit])
+        cls._extend_timeline(key, obj, load_objects, serializer, store)
+
+    @classmethod
+    def extend_object_in_redis_from_hbase(cls, key, obj, query_func, store=LIST_STORE, serializer=HBaseModelSerializer):
+        cls._extend_timeline(key, obj, query_func, serializer, store)
+
+    @classmethod
+    def get_members_in_redis(cls, key, members, load_members, limit=None):
+        """
+        => set of given members which are in the cached set, one round trip on cache hit.
+        load_members() returns all members of the set, called when the set is not cached.
+        with limit, load_members() should return at most limit + 1 members,
+        a set with more than limit members is not cached and None is returned
+        """
+        members = list(members)
+        if not members:
+            return set()
         conn = RedisClient.get_connection()
-        key = cls.get_count_key(obj, attr)
-        if not conn.exists(key):
-            obj.refresh_from_db()
-            conn.set(key, getattr(obj, attr))
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-            return getattr(obj, attr)
-        return conn.incr(key)
+        pipe = conn.pipeline(transaction=False)
+        pipe.exists(key)
+        pipe.sismember(key, SET_OVERFLOW)
+        for member in members:
+            pipe.sismember(key, member)
+        exists, overflow, *is_members = pipe.execute()
+        if overflow:
+            return None
+        if exists:
+            return {member for member, is_member in zip(members, is_members) if is_member}
+
+        # cache miss
+        all_members = set(load_members())
+        if limit is not None and len(all_members) > limit:
+            all_members = {SET_OVERFLOW}
+        cls._run_script(
+            LOAD_SET_SCRIPT,
+            keys=[key, SET_JOURNAL_PATTERN.format(key=key)],
+            args=[settings.REDIS_KEY_EXPIRE_TIME, SET_OVERFLOW, SET_PLACEHOLDER, *all_members],
+        )
+        if SET_OVERFLOW in all_members:
+            return None
+        return {member for member in members if member in all_members}
 
     @classmethod
-    def decr_count_in_redis(cls, obj, attr):
+    def _update_member_in_redis(cls, key, member, is_added, limit):
+        cls._run_script(
+            UPDATE_SET_SCRIPT,
+            keys=[key, SET_JOURNAL_PATTERN.format(key=key)],
+            args=[
+                member,
+                1 if is_added else 0,
+                -1 if limit is None else limit,
+                settings.REDIS_SET_JOURNAL_EXPIRE_TIME,
+                SET_PLACEHOLDER,
+                SET_OVERFLOW,
+            ],
+        )
+
+    @classmethod
+    def add_member_in_redis(cls, key, member, limit=None):
+        # with limit, a set growing over limit members is cached as overflowed
+        cls._update_member_in_redis(key, member, True, limit)
+
+    @classmethod
+    def remove_member_in_redis(cls, key, member):
+        cls._update_member_in_redis(key, member, False, None)
+
+    @classmethod
+    def get_counts_key(cls, model_class, object_id):
+        return COUNTS_PATTERN.format(model_name=model_class.__name__, object_id=object_id)
+
+    @classmethod
+    def _get_count_deltas_keys(cls, model_class):
+        return (
+            COUNT_DELTAS_PATTERN.format(model_name=model_class.__name__),
+            COUNT_DELTAS_PROCESSING_PATTERN.format(model_name=model_class.__name__),
+        )
+
+    @classmethod
+    def _get_pending_deltas(cls, model_class, counts):
+        """
+        counts: [(object_id, attr)]
+        => {(object_id, attr): delta}, deltas not flushed to db yet, both new ones and ones being flushed
+        """
         conn = RedisClient.get_connection()
-        key = cls.get_count_key(obj, attr)
-        if not conn.exists(key):
-            obj.refresh_from_db()
-            conn.set(key, getattr(obj, attr))
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-            return getattr(obj, attr)
-        return conn.decr(key)
+        fields = [f'{attr}:{object_id}' for object_id, attr in counts]
+        pipe = conn.pipeline(transaction=False)
+        for key in cls._get_count_deltas_keys(model_class):
+            pipe.hmget(key, fields)
+        pending_deltas = dict.fromkeys(counts, 0)
+        for deltas in pipe.execute():
+            for count, delta in zip(counts, deltas):
+                if delta is not None:
+                    pending_deltas[count] += int(delta)
+        return pending_deltas
+
+    @classmethod
+    def _get_pending_delta(cls, obj, attr):
+        return cls._get_pending_deltas(obj.__class__, [(obj.id, attr)])[(obj.id, attr)]
+
+    @classmethod
+    def _set_loaded_counts(cls, client, model_class, object_id, counts):
+        # => stored counts, they may be set by a concurrent loader or incr. client may be a pipeline
+        args = [settings.REDIS_KEY_EXPIRE_TIME]
+        for attr, count in counts.items():
+            args += [attr, count]
+        key = cls.get_counts_key(model_class, object_id)
+        return cls._run_script(LOAD_COUNTS_SCRIPT, keys=[key], args=args, client=client)
+
+    @classmethod
+    def _hold_count_load_lock(cls, model_class):
+        """
+        => True in the block if the flush lock of model is held, column and deltas read in the block
+        are not changed by a flush. loads are short, so they wait and hold it briefly
+        """
+        deltas_key, _ = cls._get_count_deltas_keys(model_class)
+        return cls._hold_lock(
+            deltas_key,
+            settings.REDIS_LOCK_TIMEOUT,
+            retries=settings.REDIS_LOCK_RETRIES,
+            wait=settings.REDIS_LOCK_WAIT,
+        )
+
+    @classmethod
+    def _load_count_to_redis(cls, obj, attr):
+        """
+        count = count in db + deltas not flushed yet, read holding the flush lock.
+        if a flush keeps holding it, count is returned but not cached.
+        obj may be shared by local cache, so the column is read by a query instead of refresh_from_db
+        """
+        with cls._hold_count_load_lock(obj.__class__) as locked:
+            columns = list(obj.__class__.objects.filter(id=obj.id).values_list(attr, flat=True))
+            if not columns:
+                # object deleted
+                return 0
+            count = (columns[0] or 0) + cls._get_pending_delta(obj, attr)
+            if not locked:
+                return count
+            stored = cls._set_loaded_counts(RedisClient.get_connection(), obj.__class__, obj.id, {attr: count})
+        return int(stored[0])
+
+    @classmethod
+    def incr_count_in_redis(cls, obj, attr, delta=1):
+        """
+        write behind, count is changed in redis only,
+        delta is kept in redis and flushed to db by flush_count_deltas
+        """
+        deltas_key, _ = cls._get_count_deltas_keys(obj.__class__)
+        count = cls._run_script(
+            INCR_COUNT_SCRIPT,
+            keys=[cls.get_counts_key(obj.__class__, obj.id), deltas_key],
+            args=[f'{attr}:{obj.id}', delta, attr],
+        )
+        if count is None:
+            return cls._load_count_to_redis(obj, attr)
+        return count
+
+    @classmethod
+    def decr_count_in_redis(cls, obj, attr):
+        return cls.incr_count_in_redis(obj, attr, delta=-1)
 
     @classmethod
     def get_count_in_redis(cls, obj, attr):
         conn = RedisClient.get_connection()
-        key = cls.get_count_key(obj, attr)
-        if not conn.exists(key):
-            obj.refresh_from_db()
-            conn.set(key, getattr(obj, attr))
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-            return getattr(obj, attr)
-        return int(conn.get(key))
+        count = conn.hget(cls.get_counts_key(obj.__class__, obj.id), attr)
+        if count is None:
+            return cls._load_count_to_redis(obj, attr)
+        return int(count)
+
+    @classmethod
+    def get_counts_in_redis(cls, model_class, object_ids, attrs):
+        """
+        => {object_id: {attr: count}}, counts of all objects are read by one pipeline of hgetall,
+        misses are loaded by one query and set by one pipeline. deleted objects are not in the dict
+        """
+        object_ids = list(object_ids)
+        if not object_ids:
+            return {}
+        conn = RedisClient.get_connection()
+        pipe = conn.pipeline(transaction=False)
+        for object_id in object_ids:
+            pipe.hgetall(cls.get_counts_key(model_class, object_id))
+        result = defaultdict(dict)
+        missed_counts = []
+        for object_id, cached in zip(object_ids, pipe.execute()):
+            for attr in attrs:
+                count = cached.get(attr.encode('utf-8'))
+                if count is None:
+                    missed_counts.append((object_id, attr))
+                else:
+                    result[object_id][attr] = int(count)
+        if not missed_counts:
+            return dict(result)
+
+        # cache miss, count = count in db + deltas not flushed yet, read holding the flush lock
+        with cls._hold_count_load_lock(model_class) as locked:
+            rows = {
+                row['id']: row
+                for row in model_class.objects.filter(
+                    id__in={object_id for object_id, _ in missed_counts},
+                ).values('id', *attrs)
+            }
+            pending_deltas = cls._get_pending_deltas(model_class, missed_counts)
+            loaded_counts = defaultdict(dict)
+            for object_id, attr in missed_counts:
+                if object_id not in rows:
+                    continue
+                loaded_counts[object_id][attr] = (rows[object_id][attr] or 0) + pending_deltas[(object_id, attr)]
+            if not locked:
+                # a flush keeps holding the lock, counts are returned but not cached
+                for object_id, counts in loaded_counts.items():
+                    result[object_id].update(counts)
+                return dict(result)
+            pipe = conn.pipeline(transaction=False)
+            for object_id, counts in loaded_counts.items():
+                cls._set_loaded_counts(pipe, model_class, object_id, counts)
+            for (object_id, counts), stored in zip(loaded_counts.items(), pipe.execute()):
+                result[object_id].update(zip(counts, map(int, stored)))
+        return dict(result)
+
+    @classmethod
+    def prefetch_counts_in_redis(cls, context, model_class, object_ids, attrs):
+        # counts read by get_prefetched_count, counts of deleted objects are kept as 0
+        prefetched = context.setdefault(PREFETCHED_COUNTS, {}).setdefault(model_class, {})
+        missed_counts = [
+            (object_id, attr)
+            for object_id in set(object_ids)
+            for attr in attrs
+            if attr not in prefetched.get(object_id, {})
+        ]
+        if not missed_counts:
+            return prefetched
+        counts = cls.get_counts_in_redis(
+            model_class,
+            {object_id for object_id, _ in missed_counts},
+            {attr for _, attr in missed_counts},
+        )
+        for object_id, attr in missed_counts:
+            prefetched.setdefault(object_id, {})[attr] = counts.get(object_id, {}).get(attr, 0)
+        return prefetched
+
+    @classmethod
+    def get_prefetched_count(cls, context, obj, attr):
+        counts = context.get(PREFETCHED_COUNTS, {}).get(obj.__class__, {}).get(obj.id, {})
+        if attr in counts:
+            return counts[attr]
+        return cls.get_count_in_redis(obj, attr)
+
+    @classmethod
+    def flush_count_deltas(cls, model_class):
+        """
+        deltas are moved to processing hash and written to db in batches by one transaction,
+        processing hash is deleted before commit and restored on rollback, so deltas are
+        never flushed twice. a worker dying between delete and commit loses them,
+        check_counts_in_redis repairs them. flushes and checks of a model are serialized
+        by a lock on its deltas hash. => number of deltas flushed
+        """
+        conn = RedisClient.get_connection()
+        deltas_key, processing_key = cls._get_count_deltas_keys(model_class)
+        with cls._hold_lock(deltas_key, settings.REDIS_COUNT_LOCK_TIMEOUT) as locked:
+            # another flush or check is running, deltas are flushed next time
+            if not locked:
+                return 0
+            if not cls._run_script(START_FLUSH_SCRIPT, keys=[deltas_key, processing_key], args=[]):
+                return 0
+
+            deltas = conn.hgetall(processing_key)
+            # objects with same attr and delta are updated by one query
+            object_ids = defaultdict(list)
+            for field, delta in deltas.items():
+                attr, object_id = field.decode('utf-8').rsplit(':', 1)
+                if int(delta):
+                    object_ids[(attr, int(delta))].append(int(object_id))
+            try:
+                with transaction.atomic():
+                    for (attr, delta), ids in object_ids.items():
+                        for batch_ids in helpers.chunks(ids, settings.REDIS_COUNT_FLUSH_BATCH_SIZE):
+                            model_class.objects.filter(id__in=batch_ids).update(**{attr: F(attr) + delta})
+                    conn.delete(processing_key)
+            except Exception:
+                # rolled back, deltas are flushed again next time
+                conn.hset(processing_key, mapping=deltas)
+                raise
+        return len(deltas)
+
+    @classmethod
+    def _get_count_drifts(cls, model_class, object_ids, attrs, count_objects):
+        """
+        => {(object_id, attr): (column drift, cache drift)} of drifted counts,
+        column drift = real count - column - deltas not flushed, cache drift = real count - cached count
+        """
+        conn = RedisClient.get_connection()
+        real_counts = count_objects(object_ids)
+        rows = model_class.objects.filter(id__in=object_ids).values('id', *attrs)
+        columns = {(row['id'], attr): row[attr] or 0 for row in rows for attr in attrs}
+        pending_deltas = cls._get_pending_deltas(model_class, list(columns))
+        pipe = conn.pipeline(transaction=False)
+        for object_id, attr in columns:
+            pipe.hget(cls.get_counts_key(model_class, object_id), attr)
+        drifts = {}
+        for (object_id, attr), cached in zip(columns, pipe.execute()):
+            real_count = real_counts.get(object_id, {}).get(attr, 0)
+            column_drift = real_count - columns[(object_id, attr)] - pending_deltas[(object_id, attr)]
+            cache_drift = 0 if cached is None else real_count - int(cached)
+            if column_drift or cache_drift:
+                drifts[(object_id, attr)] = (column_drift, cache_drift)
+        return drifts
+
+    @classmethod
+    def check_counts_in_redis(cls, model_class, object_ids, attrs, count_objects):
+        """
+        count_objects(object_ids) => {object_id: {attr: real count}}, e.g. number of likes counted in db.
+        repair db columns and cached counts drifted from real counts, => number of counts repaired.
+        counts are read holding the flush lock, so no deltas are moved to db meanwhile,
+        and read twice, drifts of counts changed in between, e.g. by a like not committed yet,
+        are not repaired
+        """
+        conn = RedisClient.get_connection()
+        deltas_key, _ = cls._get_count_deltas_keys(model_class)
+        with cls._hold_lock(
+            deltas_key,
+            settings.REDIS_COUNT_LOCK_TIMEOUT,
+            retries=settings.REDIS_COUNT_LOCK_RETRIES,
+            wait=settings.REDIS_COUNT_LOCK_WAIT,
+        ) as locked:
+            if not locked:
+                return 0
+            drifts = cls._get_count_drifts(model_class, object_ids, attrs, count_objects)
+            if not drifts:
+                return 0
+            time.sleep(settings.REDIS_COUNT_CHECK_WAIT)
+            drifts = drifts.items() & cls._get_count_drifts(model_class, object_ids, attrs, count_objects).items()
+            for (object_id, attr), (column_drift, cache_drift) in drifts:
+                if column_drift:
+                    model_class.objects.filter(id=object_id).update(**{attr: F(attr) + column_drift})
+                if cache_drift:
+                    # loaded again on next read
+                    conn.hdel(cls.get_counts_key(model_class, object_id), attr)
+        return len(drifts)
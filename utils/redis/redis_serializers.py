@@ -1,10 +1,16 @@
 from django.core import serializers
+from utils import helpers
 from utils.hbase.models import HBaseModel
 from utils.redis.json_encoder import JSONEncoder
 import json
+import struct
 
 
 class DjangoModelSerializer:
+    key_suffix = ''
+    # offset of created_at packed in serialized data, None if it is not packed
+    created_at_offset = None
+
     @classmethod
     def serialize(cls, instance):
         return serializers.serialize('json', [instance], cls=JSONEncoder)
@@ -13,8 +19,15 @@ class DjangoModelSerializer:
     def deserialize(cls, serialized_data):
         return list(serializers.deserialize('json', serialized_data))[0].object
 
+    @classmethod
+    def hydrate(cls, objects):
+        return objects
+
 
 class HBaseModelSerializer:
+    key_suffix = ''
+    created_at_offset = None
+
     @classmethod
     def _get_model_class(cls, model_class_name):
         for subclass in HBaseModel.__subclasses__():
@@ -25,8 +38,7 @@ class HBaseModelSerializer:
     @classmethod
     def serialize(cls, instance):
         json_data = {'model_class_name': instance.__class__.__name__}
-        for key in instance.get_field_hash():
-            json_data[key] = getattr(instance, key)
+        json_data.update(instance.to_dict())
         return json.dumps(json_data)
 
     @classmethod
@@ -35,3 +47,142 @@ class HBaseModelSerializer:
         model_class = cls._get_model_class(json_data.pop('model_class_name'))
         return model_class(**json_data)
 
+    @classmethod
+    def hydrate(cls, objects):
+        return objects
+
+
+class PackedFieldsSerializer:
+    """
+    only int fields of an object are cached, each packed into 8 bytes,
+    datetime fields are packed as microsecond timestamp.
+    subclass defines model_class and fields, and hydrates objects read from one page in a batch.
+    """
+    key_suffix = ':ids'
+    model_class = None
+    fields = ('created_at', 'id')
+    datetime_fields = ('created_at',)
+    created_at_offset = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.created_at_offset = 8 * cls.fields.index('created_at') if 'created_at' in cls.fields else None
+
+    @classmethod
+    def serialize(cls, instance):
+        values = []
+        for field in cls.fields:
+            value = getattr(instance, field)
+            if field in cls.datetime_fields and not isinstance(value, int):
+                value = helpers.datetime_to_timestamp(value)
+            values.append(value)
+        return struct.pack(f'>{len(cls.fields)}q', *values)
+
+    @classmethod
+    def deserialize(cls, serialized_data):
+        values = struct.unpack(f'>{len(cls.fields)}q', serialized_data)
+        kwargs = {}
+        for field, value in zip(cls.fields, values):
+            if field in cls.datetime_fields:
+                value = helpers.timestamp_to_datetime(value)
+            kwargs[field] = value
+        return cls.model_class(**kwargs)
+
+    @classmethod
+    def hydrate(cls, objects):
+        return objects
+
+
+class StructModelSerializer:
+    """
+    compact binary codec driven by the field list of subclass, e.g.
+        fields = (('id', 'int'), ('created_at', 'datetime'), ('content', 'str'))
+    int and datetime fields are packed as 8 bytes, str fields as utf-8 bytes with their lengths,
+    None values are marked in a null bitmap.
+    data starts with the schema version, bump version when fields change,
+    the version is also in the redis key so old data is never read by new schema.
+    """
+    model_class = None
+    version = 1
+    fields = ()
+    created_at_offset = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if len(cls.fields) > 64:
+            raise ValueError('at most 64 fields are supported')
+        for name, kind in cls.fields:
+            if kind not in ('int', 'datetime', 'str'):
+                raise ValueError(f'unknown type {kind} of field {name}')
+        # (null bit, field name, is datetime)
+        cls._fixed_fields = tuple(
+            (1 << idx, name, kind == 'datetime')
+            for idx, (name, kind) in enumerate(cls.fields)
+            if kind in ('int', 'datetime')
+        )
+        # (null bit, field name)
+        cls._str_fields = tuple(
+            (1 << idx, name)
+            for idx, (name, kind) in enumerate(cls.fields)
+            if kind == 'str'
+        )
+        # version, null bitmap, fixed values, lengths of str values
+        cls._header = struct.Struct(f'>BQ{len(cls._fixed_fields)}q{len(cls._str_fields)}I')
+        fixed_names = [name for _, name, _ in cls._fixed_fields]
+        cls.created_at_offset = 9 + 8 * fixed_names.index('created_at') if 'created_at' in fixed_names else None
+        cls.key_suffix = f':v{cls.version}'
+
+    @classmethod
+    def serialize(cls, instance):
+        null_bits = 0
+        values = []
+        for bit, name, is_datetime in cls._fixed_fields:
+            value = getattr(instance, name)
+            if value is None:
+                null_bits |= bit
+                value = 0
+            elif is_datetime:
+                value = helpers.datetime_to_timestamp(value)
+            values.append(value)
+        strings = []
+        for bit, name in cls._str_fields:
+            value = getattr(instance, name)
+            if value is None:
+                null_bits |= bit
+                value = b''
+            else:
+                value = value.encode('utf-8')
+            strings.append(value)
+            values.append(len(value))
+        return cls._header.pack(cls.version, null_bits, *values) + b''.join(strings)
+
+    @classmethod
+    def deserialize(cls, serialized_data):
+        values = cls._header.unpack_from(serialized_data)
+        if values[0] != cls.version:
+            raise ValueError(f'{cls.__name__} version {values[0]} is not {cls.version}')
+        null_bits = values[1]
+        kwargs = {}
+        idx = 2
+        for bit, name, is_datetime in cls._fixed_fields:
+            value = values[idx]
+            idx += 1
+            if null_bits & bit:
+                value = None
+            elif is_datetime:
+                value = helpers.timestamp_to_datetime(value)
+            kwargs[name] = value
+        position = cls._header.size
+        for bit, name in cls._str_fields:
+            length = values[idx]
+            idx += 1
+            if null_bits & bit:
+                kwargs[name] = None
+            else:
+                kwargs[name] = serialized_data[position:position + length].decode('utf-8')
+            position += length
+        return cls.model_class(**kwargs)
+
+    @classmethod
+    def hydrate(cls, objects):
+        return objects
@@ -9,3 +9,41 @@ REDIS_PORT = 6379
 REDIS_DB = 0 if ((" ".join(sys.argv)).find('manage.py test') == -1) else 1
 REDIS_KEY_EXPIRE_TIME = 7 * 86400  # in seconds
 REDIS_LIST_LENGTH_LIMIT = 1000 if not ((" ".join(sys.argv)).find('manage.py test') == -1) else 10
+# 'list' or 'zset', zset keeps timeline ordered and deduped, and finds cursor by score
+# list finds cursor by binary search, in one script for ids and struct entries,
+# but one LINDEX round trip per step for json entries
+REDIS_TIMELINE_STORES = {
+    'tweets': 'list',
+    'newsfeeds': 'list',
+}
+# 'ids' caches only packed ids of timeline objects and hydrates them from memcached,
+# 'objects' caches whole objects in timelines. tweets are edited and hydrated from memcached,
+# newsfeeds are small fixed width rows never changed, so they are cached whole
+REDIS_TIMELINE_ENTRIES = {
+    'tweets': 'ids',
+    'newsfeeds': 'objects',
+}
+# 'struct' or 'json', codec of whole objects cached in redis
+REDIS_OBJECT_SERIALIZER = 'struct'
+# lock of RedisHelper._load_with_lock, a missed timeline is loaded by its holder only
+REDIS_LOCK_TIMEOUT = 5  # in seconds
+REDIS_LOCK_RETRIES = 20
+REDIS_LOCK_WAIT = 0.05  # in seconds
+# write behind counts, deltas are flushed to db by tweets.tasks.flush_count_deltas_task
+REDIS_COUNT_FLUSH_BATCH_SIZE = 1000
+# flushes and checks of a model hold one lock, it outlives the time limit of flush task
+REDIS_COUNT_LOCK_TIMEOUT = 120  # in seconds
+REDIS_COUNT_LOCK_RETRIES = 60
+REDIS_COUNT_LOCK_WAIT = 1  # in seconds
+# drifts are read twice in this interval by checks, only drifts read both times are repaired
+REDIS_COUNT_CHECK_WAIT = 1 if ((" ".join(sys.argv)).find('manage.py test') == -1) else 0  # in seconds
+# counts of objects created in these days are checked by tweets.tasks.check_counts_task
+REDIS_COUNT_CHECK_DAYS = 7
+# likers of an object are cached in one set up to this many, has_liked of more liked objects
+# is checked in the set of objects liked by user
+REDIS_OBJECT_LIKERS_LIMIT = 1000
+# ids of objects liked by a user are cached in one set up to this many, has_liked of users
+# liked more objects is checked in db for the ids of a page
+REDIS_USER_LIKED_LIMIT = 1000
+# changes of a set not cached are kept this long, to be applied by a load reading db meanwhile
+REDIS_SET_JOURNAL_EXPIRE_TIME = 60  # in seconds
@@ -1,6 +1,13 @@
+from datetime import timedelta
+from utils import helpers
 from utils.test_helpers import TestHelpers
 from django.test import TestCase
+from django.test.utils import override_settings
+from tweets.models import Tweet
+from tweets.redis_serializers import TweetIdSerializer
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper, ZSET_STORE
+from utils.redis.redis_serializers import DjangoModelSerializer
 
 
 class UtilTests(TestCase):
@@ -17,4 +24,150 @@ class UtilTests(TestCase):
 
         RedisClient.clear()
         cached_list = conn.lrange('key', 0, -1)
-        self.assertEqual(cached_list, [])
\ No newline at end of file
+        self.assertEqual(cached_list, [])
+
+    def test_objects_in_redis(self):
+        conn = RedisClient.get_connection()
+        user = TestHelpers.create_user()
+        tweets = [TestHelpers.create_tweet(user, f'tweet{i}') for i in range(3)]
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at')
+        conn.delete('key')
+
+        # cache miss, load from DB
+        self.assertEqual(RedisHelper.get_objects_in_redis_from_sql('key', queryset), tweets[::-1])
+        self.assertEqual(conn.llen('key'), 3)
+        # loading again will not duplicate objects
+        RedisHelper._load_objects_to_redis('key', tweets, DjangoModelSerializer)
+        self.assertEqual(conn.llen('key'), 3)
+
+        # cache hit
+        self.assertEqual(RedisHelper.get_objects_in_redis_from_sql('key', queryset), tweets[::-1])
+
+        # extend cached list
+        tweet = TestHelpers.create_tweet(user, 'tweet3')
+        RedisHelper.extend_object_in_redis_from_sql('key', tweet, queryset)
+        self.assertEqual(
+            RedisHelper.get_objects_in_redis_from_sql('key', queryset),
+            [tweet] + tweets[::-1],
+        )
+
+        # extend not cached list, load from DB
+        conn.delete('key')
+        RedisHelper.extend_object_in_redis_from_sql('key', tweet, queryset)
+        self.assertEqual(conn.llen('key'), 4)
+
+    def test_page_in_redis(self):
+        conn = RedisClient.get_connection()
+        user = TestHelpers.create_user()
+        tweets = [TestHelpers.create_tweet(user, f'tweet{i}') for i in range(5)]
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at')
+        conn.delete('key')
+
+        # cache miss, page is sliced from loaded objects
+        objects, _, length = RedisHelper.get_page_in_redis_from_sql('key', queryset, size=2)
+        self.assertEqual(objects, [tweets[4], tweets[3]])
+        self.assertEqual(length, 5)
+        self.assertEqual(conn.llen('key'), 5)
+
+        # cache hit, page after cursor
+        objects, _, length = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, created_at__lt=tweets[3].created_at, size=2)
+        self.assertEqual(objects, [tweets[2], tweets[1]])
+        self.assertEqual(length, 5)
+        objects, _, _ = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, created_at__lt=tweets[0].created_at, size=2)
+        self.assertEqual(objects, [])
+
+        # newer objects than cursor
+        objects, _, _ = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, created_at__gt=tweets[2].created_at)
+        self.assertEqual(objects, [tweets[4], tweets[3]])
+        objects, _, _ = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, created_at__gt=tweets[4].created_at)
+        self.assertEqual(objects, [])
+
+        # created_at is packed in entries, cursor is found in one script
+        conn.delete('key')
+        RedisHelper.get_page_in_redis_from_sql('key', queryset, serializer=TweetIdSerializer, size=2)
+        objects, entries_count, length = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, serializer=TweetIdSerializer, created_at__lt=tweets[3].created_at, size=2)
+        self.assertEqual((objects, entries_count, length), ([tweets[2], tweets[1]], 2, 5))
+        objects, _, _ = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, serializer=TweetIdSerializer, created_at__gt=tweets[2].created_at)
+        self.assertEqual(objects, [tweets[4], tweets[3]])
+
+    def test_page_in_zset(self):
+        conn = RedisClient.get_connection()
+        user = TestHelpers.create_user()
+        tweets = [TestHelpers.create_tweet(user, f'tweet{i}') for i in range(5)]
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at')
+        conn.delete('key')
+
+        # cache miss, load from DB
+        objects, _, length = RedisHelper.get_page_in_redis_from_sql('key', queryset, store=ZSET_STORE, size=2)
+        self.assertEqual(objects, [tweets[4], tweets[3]])
+        self.assertEqual(length, 5)
+        self.assertEqual(conn.zcard('key'), 5)
+
+        # cache hit, page by score
+        objects, _, _ = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, store=ZSET_STORE, created_at__lt=tweets[3].created_at, size=2)
+        self.assertEqual(objects, [tweets[2], tweets[1]])
+        objects, _, _ = RedisHelper.get_page_in_redis_from_sql(
+            'key', queryset, store=ZSET_STORE, created_at__gt=tweets[2].created_at)
+        self.assertEqual(objects, [tweets[4], tweets[3]])
+
+        # extending same object is deduped, out of order object keeps its position
+        conn.zremrangebyrank('key', 0, 0)
+        RedisHelper.extend_object_in_redis_from_sql('key', tweets[0], queryset, store=ZSET_STORE)
+        RedisHelper.extend_object_in_redis_from_sql('key', tweets[0], queryset, store=ZSET_STORE)
+        self.assertEqual(
+            RedisHelper.get_objects_in_redis_from_sql('key', queryset, store=ZSET_STORE),
+            tweets[::-1],
+        )
+
+        # scores are the microsecond timestamps of cursors, paging across boundaries never skips or repeats
+        conn.delete('key')
+        created_at = helpers.timestamp_to_datetime(1633046400999999)
+        for i, tweet in enumerate(tweets):
+            Tweet.objects.filter(id=tweet.id).update(created_at=created_at + timedelta(microseconds=i))
+        self.assertEqual(
+            RedisHelper.get_page_in_redis_from_sql('key', queryset, store=ZSET_STORE, size=2)[0],
+            [tweets[4], tweets[3]],
+        )
+        self.assertEqual(conn.zscore('key', DjangoModelSerializer.serialize(queryset[0])), 1633046401000003)
+        paged, cursor = [], None
+        while True:
+            objects, _, _ = RedisHelper.get_page_in_redis_from_sql(
+                'key', queryset, store=ZSET_STORE, created_at__lt=cursor, size=2)
+            if not objects:
+                break
+            paged += objects
+            cursor = objects[-1].created_at
+        self.assertEqual(paged, tweets[::-1])
+
+    def test_load_with_lock(self):
+        conn = RedisClient.get_connection()
+
+        # lock holder loads and releases the lock
+        self.assertEqual(RedisHelper._load_with_lock('key', lambda: 'loaded', lambda: None), 'loaded')
+        self.assertFalse(conn.exists('lock:key'))
+
+        # lock expired while loading and taken by another worker is not released
+        def load():
+            conn.set('lock:key', 'other')
+            return 'loaded'
+
+        self.assertEqual(RedisHelper._load_with_lock('key', load, lambda: None), 'loaded')
+        self.assertEqual(conn.get('lock:key'), b'other')
+
+        # others wait for the cache filled by lock holder
+        conn.set('lock:key', 1)
+        cached = iter([None, 'cached'])
+        with override_settings(REDIS_LOCK_WAIT=0):
+            self.assertEqual(
+                RedisHelper._load_with_lock('key', lambda: 'loaded', lambda: next(cached)),
+                'cached',
+            )
+            # load themselves if cache is not filled in time
+            self.assertEqual(RedisHelper._load_with_lock('key', lambda: 'loaded', lambda: None), 'loaded')
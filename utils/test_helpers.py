@@ -7,6 +7,7 @@ from likes.models import Like
 from tweets.models import Tweet
 from utils.gatekeeper.models import GateKeeper
 from utils.hbase.hbase_client import HBaseClient
+from utils.memcached.local_cache import LocalCache
 from utils.memcached.memcached_helper import project_memcached
 from utils.redis.redis_client import RedisClient
 
@@ -15,6 +16,7 @@ class TestHelpers:
     @classmethod
     def clear_cache(cls):
         project_memcached.clear()
+        LocalCache.clear()
         RedisClient.clear()
         HBaseClient.clear()
         GateKeeper.turn_on('switch_friendship_to_hbase')